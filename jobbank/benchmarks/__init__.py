@@ -0,0 +1,2 @@
+# Offline benchmarks for the jobbank project. Run them from the directory
+# holding scrapy.cfg, e.g. `python -m benchmarks.memory`.
@@ -0,0 +1,76 @@
+"""
+Detail page parsing: checks that JobbankSpider.parse_detail extracts the
+recorded fields of the detail page fixture, then measures its throughput.
+
+    python -m benchmarks.details
+"""
+import json
+import os
+import time
+
+from scrapy.http import HtmlResponse, Request
+
+from benchmarks.fixtures import FIXTURES_DIR
+from benchmarks.parsing import make_spider
+
+JOB_POSTING = os.path.join(FIXTURES_DIR, 'job_posting.html')
+JOB_POSTING_FIELDS = os.path.join(FIXTURES_DIR, 'job_posting.json')
+JOB_LINK = 'https://www.jobbank.gc.ca/jobsearch/jobposting/41842445'
+
+
+def detail_response(path=JOB_POSTING, job_link=JOB_LINK):
+    """The response parse_detail gets for the detail page in ``path``."""
+    with open(path, 'rb') as f:
+        body = f.read()
+    request = Request(job_link, meta={'job_link': job_link,
+                                      'listing_hash': 'fixture'})
+    return HtmlResponse(url=job_link, body=body, encoding='utf-8',
+                        request=request)
+
+
+def parse_detail(spider, response):
+    items = list(spider.parse_detail(response))
+    assert len(items) == 1, f'parse_detail returned {len(items)} items'
+    return items[0]
+
+
+def check_output(spider):
+    """
+    Raises AssertionError unless parse_detail returns the recorded fields
+    of the fixture.
+    """
+    with open(JOB_POSTING_FIELDS, encoding='utf-8') as f:
+        expected = json.load(f)
+    item = parse_detail(spider, detail_response())
+    actual = {field: item.get(field) for field in expected}
+    assert actual == expected, f'parse_detail output differs: {actual}'
+    assert item['job_link'] == JOB_LINK
+
+
+def bench_parse_detail(spider, min_seconds=1.0):
+    """Detail pages parsed per second."""
+    response = detail_response()
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        # A new response each time, as Scrapy caches the parsed selector
+        parse_detail(spider, response.replace())
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+    return {
+        'benchmark': 'parse_detail',
+        'pages_per_sec': round(runs / elapsed),
+        'ms_per_page': round(elapsed / runs * 1000, 3),
+    }
+
+
+def run():
+    spider = make_spider()
+    check_output(spider)
+    return [bench_parse_detail(spider)]
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,33 @@
+"""Builds search result pages of any size from the recorded fixture."""
+import os
+import re
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+SEARCH_RESULTS = os.path.join(FIXTURES_DIR, 'search_results.html')
+
+ARTICLE_RE = re.compile(r'<article .*?</article>\n', re.S)
+JOB_ID_RE = re.compile(r'(?<=article-)\d+|(?<=jobposting/)\d+')
+
+
+def load_articles(path=SEARCH_RESULTS):
+    with open(path, encoding='utf-8') as f:
+        return ARTICLE_RE.findall(f.read())
+
+
+def articles_html(count, offset=0, articles=None):
+    """
+    Returns the markup of ``count`` result articles. Articles repeat the
+    fixture but get distinct job ids, starting after ``offset``.
+    """
+    articles = articles or load_articles()
+    html = []
+    for i in range(offset, offset + count):
+        job_id = str(40000000 + i)
+        html.append(JOB_ID_RE.sub(job_id, articles[i % len(articles)]))
+    return ''.join(html)
+
+
+def page_html(count, offset=0, articles=None):
+    """A result page as returned to the spider, holding ``count`` articles."""
+    return (f'<html><body>{articles_html(count, offset, articles)}'
+            '</body></html>')
@@ -0,0 +1,193 @@
+"""
+The HTTP engine against a stub of Job Bank's JSF endpoints serving recorded
+pages: the search page, then two "Show More" partial responses and an empty
+one ending the search, and the detail page fixture for every posting. The
+stub rejects requests that do not carry the session cookie and the view
+state of the previous response, so the run checks the whole ViewState
+chain as well as the parsed postings and details.
+
+    python -m benchmarks.httpengine
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+from benchmarks.details import JOB_POSTING
+from benchmarks.fixtures import FIXTURES_DIR, SEARCH_RESULTS
+from jobbank.items import JobDetailItem, JobRecord
+from jobbank.spiders.jobbank_spider import JobbankSpider
+
+SEARCH_PATH = '/jobsearch/jobsearch'
+POSTING_PATH = '/jobsearch/jobposting/'
+LOADER_PATH = '/jobsearch/job_search_loader.xhtml'
+SESSION_COOKIE = 'JSESSIONID=8F1C2B7A90E3D4C5B6A7F8E9D0C1B2A3.jobsearch76'
+
+# The view state each "Show More" request must carry, by page; the search
+# page holds the first one and every partial response the next
+VIEW_STATES = {
+    2: '-4087318390193651727:-2351837621298475731',
+    3: '-4087318390193651727:6172301826520384811',
+    4: '-4087318390193651727:-8830125671542091457',
+}
+LOADER_PAGES = {page: os.path.join(FIXTURES_DIR, f'search_loader_page{page}.xml')
+                for page in VIEW_STATES}
+
+# Postings on the search page and the two partial responses holding results
+EXPECTED_ITEMS = 75
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves the recorded pages and records the requests it rejected."""
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        path = urlparse(self.path).path
+        if path.startswith(POSTING_PATH):
+            return self._reply(200, _read(JOB_POSTING),
+                               'text/html; charset=utf-8')
+        if path != SEARCH_PATH:
+            return self._reply(404, b'')
+        self._reply(200, _read(SEARCH_RESULTS), 'text/html; charset=utf-8',
+                    {'Set-Cookie': f'{SESSION_COOKIE}; Path=/jobsearch'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = {name: values[0] for name, values in
+                parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+        self.server.requests.append(('POST', self.path, form))
+        if urlparse(self.path).path != LOADER_PATH:
+            return self._reply(404, b'')
+
+        page = int(form.get('page', 0))
+        problems = []
+        if page not in LOADER_PAGES:
+            problems.append(f'unexpected page {page}')
+        elif form.get('javax.faces.ViewState') != VIEW_STATES[page]:
+            problems.append(f'stale view state for page {page}')
+        if form.get('javax.faces.partial.ajax') != 'true':
+            problems.append('not a partial request')
+        if form.get('javax.faces.source') != 'moreresultbutton':
+            problems.append('wrong source')
+        if SESSION_COOKIE not in self.headers.get('Cookie', ''):
+            problems.append('no session cookie')
+        if problems:
+            self.server.errors.extend(problems)
+            return self._reply(400, b'')
+        self._reply(200, _read(LOADER_PAGES[page]), 'text/xml; charset=utf-8')
+
+    def _reply(self, status, body, content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubSpider(JobbankSpider):
+    """JobbankSpider without the state it would share with real crawls."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen_index = None
+        self.checkpoint = None
+        self.capture = None
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.errors = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def crawl(server):
+    """
+    Runs the HTTP engine against ``server`` and returns the items it
+    scraped. Starts the reactor, so it can only run once per process.
+    """
+    settings = get_project_settings()
+    settings.setdict({
+        'ITEM_PIPELINES': {},
+        'EXTENSIONS': {},
+        'METRICS_ENABLED': False,
+        'HTTPCACHE_ENABLED': False,
+        'ROBOTSTXT_OBEY': False,
+        'DOWNLOAD_DELAY': 0,
+        'CONCURRENT_REQUESTS_PER_IP': 0,
+        'LOG_FILE': None,
+        'LOG_LEVEL': 'WARNING',
+    }, priority='cmdline')
+
+    items = []
+
+    def collect(item):
+        items.append(item)
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(StubSpider)
+    crawler.signals.connect(collect, signal=signals.item_scraped)
+    host, port = server.server_address
+    process.crawl(crawler, engine='http',
+                  start_url=f'http://{host}:{port}{SEARCH_PATH}')
+    process.start()
+    return items
+
+
+def check_output(server, items):
+    """
+    Raises AssertionError unless every page was requested and parsed, and
+    the details of every posting fetched.
+    """
+    assert not server.errors, f'Stub rejected requests: {server.errors}'
+    pages = [request[2]['page'] for request in server.requests
+             if request[0] == 'POST']
+    assert pages == ['2', '3', '4'], f'Loader requests for pages {pages}'
+    postings = [item for item in items if isinstance(item, JobRecord)]
+    links = {item.job_link for item in postings}
+    assert len(postings) == len(links) == EXPECTED_ITEMS, (
+        f'{len(postings)} postings, {len(links)} distinct, '
+        f'expected {EXPECTED_ITEMS}')
+    details = {item['job_link'] for item in items
+               if isinstance(item, JobDetailItem)}
+    assert details == links, (
+        f'Details of {len(details)} postings, expected {len(links)}')
+
+
+def run():
+    server = start_stub()
+    try:
+        start = time.perf_counter()
+        items = crawl(server)
+        elapsed = time.perf_counter() - start
+        check_output(server, items)
+    finally:
+        server.shutdown()
+    return [{
+        'benchmark': 'http_engine',
+        'pages': len(VIEW_STATES),
+        'items': len(items),
+        'seconds': round(elapsed, 4),
+    }]
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(), indent=2))
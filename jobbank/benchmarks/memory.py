@@ -0,0 +1,69 @@
+"""
+Memory held by postings waiting in the writer queue, as JobbankItem and as
+the compact JobRecord.
+
+    python -m benchmarks.memory --count 100000
+"""
+import argparse
+import json
+import queue
+import tracemalloc
+
+from jobbank.items import JobbankItem, JobRecord
+
+
+def posting(i):
+    # Scraped strings are distinct per posting, dates repeat
+    return {
+        'title': f'Software developer {i}',
+        'date': f'June {i % 28 + 1}, 2024',
+        'business': f'Employer {i % 5000}',
+        'location': f'Toronto ({"ON" if i % 2 else "QC"})',
+        'salary': f'${20 + i % 30}.00 hourly',
+        'job_link': f'https://www.jobbank.gc.ca/jobsearch/jobposting/{40000000 + i}',
+    }
+
+
+def as_jobbank_item(fields):
+    return JobbankItem(**fields, **JobRecord.constants)
+
+
+def as_job_record(fields):
+    return JobRecord(**fields)
+
+
+def queued_bytes(factory, count):
+    """Bytes allocated by ``count`` postings sitting in a queue.Queue."""
+    postings = [posting(i) for i in range(count)]
+    tracemalloc.start()
+    item_queue = queue.Queue()
+    for fields in postings:
+        item_queue.put(factory(fields))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def run(count):
+    item_bytes = queued_bytes(as_jobbank_item, count)
+    record_bytes = queued_bytes(as_job_record, count)
+    return {
+        'benchmark': 'queued_posting_memory',
+        'count': count,
+        'jobbank_item_bytes': item_bytes,
+        'job_record_bytes': record_bytes,
+        'jobbank_item_bytes_per_posting': round(item_bytes / count, 1),
+        'job_record_bytes_per_posting': round(record_bytes / count, 1),
+        'reduction': round(1 - record_bytes / item_bytes, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.count), indent=2))
+
+
+if __name__ == '__main__':
+    main()
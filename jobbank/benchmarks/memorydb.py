@@ -0,0 +1,73 @@
+"""
+In-memory stand-in for the parts of a pymongo collection the pipeline
+uses, so pipeline throughput can be measured without a mongod.
+"""
+from datetime import datetime, timezone
+
+from pymongo.results import BulkWriteResult
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.documents = {}  # job_link -> document
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def create_indexes(self, models):
+        return []
+
+    def index_information(self):
+        return {}
+
+    def find(self, filter=None, projection=None):
+        for document in list(self.documents.values()):
+            if projection:
+                fields = [field for field, keep in projection.items() if keep]
+                document = {field: document[field] for field in fields
+                            if field in document}
+            yield document
+
+    def bulk_write(self, operations, ordered=True):
+        upserted = modified = 0
+        for operation in operations:
+            link = operation._filter['job_link']
+            if isinstance(link, dict):  # UpdateMany of {'$in': links}
+                for link in link['$in']:
+                    if link in self.documents:
+                        self.documents[link].update(operation._doc['$set'])
+                        modified += 1
+                continue
+            document = self.documents.get(link)
+            if document is None:
+                if not operation._upsert:
+                    continue
+                document = self.documents[link] = {'job_link': link}
+                document.update(operation._doc.get('$setOnInsert', {}))
+                upserted += 1
+            else:
+                modified += 1
+            document.update(operation._doc.get('$set', {}))
+            now = datetime.now(timezone.utc)
+            for field in operation._doc.get('$currentDate', {}):
+                document[field] = now
+        return BulkWriteResult({
+            'nUpserted': upserted,
+            'nModified': modified,
+            'writeErrors': [],
+        }, True)
+
+
+class AsyncMemoryCollection(MemoryCollection):
+    """MemoryCollection with the coroutine API of an async client."""
+
+    async def bulk_write(self, operations, ordered=True):
+        return super().bulk_write(operations, ordered)
+
+
+class MemoryClient:
+    def __init__(self):
+        self.collection = MemoryCollection()
+
+    def close(self):
+        pass
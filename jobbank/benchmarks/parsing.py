@@ -0,0 +1,146 @@
+"""
+Listing parser throughput: jobbank.parsing against the selector-based
+parser it replaced, over pages of growing size, and the cost of paging
+through a search with full-page versus incremental parsing.
+
+    python -m benchmarks.parsing
+"""
+import json
+import time
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.fixtures import load_articles, page_html
+from jobbank.items import JobRecord
+from jobbank.spiders.jobbank_spider import JobbankSpider
+from jobbank.transformations import clean_text, transform_job_link, transform_title
+
+PAGE_SIZES = (25, 250, 1000, 5000)
+SEARCH_URL = 'https://www.jobbank.gc.ca/jobsearch/jobsearch'
+
+
+def make_spider():
+    spider = JobbankSpider()
+    spider.seen_index = None  # Measure parsing, not the seen index
+    return spider
+
+
+def response_for(html):
+    return HtmlResponse(url=SEARCH_URL, body=html, encoding='utf-8')
+
+
+def selector_parse(spider, response):
+    """
+    The Scrapy selector parser JobbankSpider used before jobbank.parsing,
+    kept as the reference for its output and speed.
+    """
+    for job in response.css('article.action-buttons'):
+        try:
+            title = job.css('h3.title span.noctitle::text').get()
+            date = job.css('ul.list-unstyled li.date::text').get().strip()
+            business = job.css('ul.list-unstyled li.business::text').get()
+            location = job.css('ul.list-unstyled li.location::text').getall()
+            salary = job.css('ul.list-unstyled li.salary::text').get()
+            job_link = job.css('a.resultJobItem::attr(href)').get()
+
+            location_text = ' '.join(location).strip(
+            ) if location else 'Not specified'
+
+            yield JobRecord(
+                title=transform_title(clean_text(title), spider.unwanted_text),
+                date=date,
+                business=clean_text(business),
+                location=location_text,
+                salary=clean_text(salary),
+                job_link=transform_job_link(job_link, spider.base_url),
+            )
+        except Exception:
+            continue
+
+
+PARSERS = {
+    'selectors': lambda spider, html: list(
+        selector_parse(spider, response_for(html))),
+    'lxml': lambda spider, html: list(spider._parse_jobs(response_for(html))),
+}
+
+
+def parse_page(spider, html, parser='lxml'):
+    return PARSERS[parser](spider, html)
+
+
+def check_output(spider):
+    """
+    Raises AssertionError unless both parsers return the same records for
+    the recorded fixtures.
+    """
+    articles = load_articles()
+    for html in (page_html(len(articles), articles=articles),
+                 page_html(250, articles=articles)):
+        expected = parse_page(spider, html, 'selectors')
+        actual = parse_page(spider, html, 'lxml')
+        assert expected, 'The fixtures hold no parsable articles'
+        assert actual == expected, 'jobbank.parsing output differs'
+
+
+def bench_parse_jobs(spider, sizes=PAGE_SIZES, min_seconds=1.0):
+    """Items per second parsed from pages holding ``sizes`` articles."""
+    articles = load_articles()
+    results = []
+    for parser in PARSERS:
+        for size in sizes:
+            html = page_html(size, articles=articles)
+            runs = 0
+            items = 0
+            start = time.perf_counter()
+            while True:
+                items += len(parse_page(spider, html, parser))
+                runs += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_seconds:
+                    break
+            results.append({
+                'benchmark': 'parse_jobs',
+                'parser': parser,
+                'articles': size,
+                'items_per_sec': round(items / elapsed),
+                'ms_per_page': round(elapsed / runs * 1000, 3),
+            })
+    return results
+
+
+def bench_paging(spider, pages=40, page_size=25):
+    """
+    Parsing cost of ``pages`` "Show More" clicks, re-parsing the whole
+    result list each time versus only the appended articles.
+    """
+    articles = load_articles()
+    results = []
+    for mode in ('full', 'incremental'):
+        start = time.perf_counter()
+        items = 0
+        for page in range(1, pages + 1):
+            if mode == 'full':
+                html = page_html(page * page_size, articles=articles)
+            else:
+                html = page_html(page_size, (page - 1) * page_size, articles)
+            items += len(parse_page(spider, html))
+        elapsed = time.perf_counter() - start
+        results.append({
+            'benchmark': 'paging',
+            'mode': mode,
+            'pages': pages,
+            'items_parsed': items,
+            'seconds': round(elapsed, 4),
+        })
+    return results
+
+
+def run():
+    spider = make_spider()
+    check_output(spider)
+    return bench_parse_jobs(spider) + bench_paging(spider)
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(), indent=2))
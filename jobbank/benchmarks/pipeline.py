@@ -0,0 +1,171 @@
+"""
+Pipeline cost: validation and transformation per item, near-duplicate
+detection per item, and end-to-end throughput from process_item to the
+collection, against an in-memory stand-in or a local mongod. Also checks
+that the pages of items passed through the async pipeline get acked.
+
+    python -m benchmarks.pipeline [--mongo-uri mongodb://localhost:27017/]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.fixtures import page_html
+from benchmarks.memorydb import AsyncMemoryCollection, MemoryClient
+from benchmarks.parsing import SEARCH_URL, make_spider
+from jobbank.checkpoint import Checkpoint, PageAcks
+from jobbank.dedupe import DuplicateIndex
+from jobbank.items import as_item
+from jobbank.pipelines import AsyncJobbankPipeline, JobbankPipeline
+from jobbank.writer import AsyncBulkWriter
+
+BENCHMARK_COLLECTION = 'benchmark_jobs'
+
+
+class BenchmarkPipeline(JobbankPipeline):
+    """Writes to a throwaway collection, in memory unless mongo_uri is set."""
+
+    def __init__(self, mongo_uri=None):
+        self.benchmark_uri = mongo_uri
+
+    def _connect(self):
+        if self.benchmark_uri is None:
+            self.client = MemoryClient()
+            self.collection = self.client.collection
+            return
+        self.mongo_uri = self.benchmark_uri
+        self.mongo_collection = BENCHMARK_COLLECTION
+        super()._connect()
+        self.collection.drop()
+
+    def _open_spool(self, settings):
+        self.spool = None  # Leave the crawl's spool alone
+        return []
+
+    def _open_dedupe(self, settings):
+        return DuplicateIndex(':memory:')  # Nor its duplicate index
+
+
+def make_records(spider, count):
+    response = HtmlResponse(url=SEARCH_URL, body=page_html(count),
+                            encoding='utf-8')
+    return list(spider._parse_jobs(response))
+
+
+def bench_validate_transform(count=20000):
+    spider = make_spider()
+    pipeline = JobbankPipeline()
+    pipeline.spider = spider
+    records = make_records(spider, count)
+
+    start = time.perf_counter()
+    for record in records:
+        item = pipeline._validate_item(as_item(record))
+        pipeline._process_data(item)
+    elapsed = time.perf_counter() - start
+    return {
+        'benchmark': 'validate_transform',
+        'items': count,
+        'us_per_item': round(elapsed / count * 1e6, 2),
+    }
+
+
+def bench_end_to_end(count=20000, mongo_uri=None):
+    spider = make_spider()
+    records = make_records(spider, count)
+    pipeline = BenchmarkPipeline(mongo_uri)
+
+    start = time.perf_counter()
+    pipeline.open_spider(spider)
+    for record in records:
+        pipeline.process_item(record, spider)
+    pipeline.close_spider(spider)
+    elapsed = time.perf_counter() - start
+    return {
+        'benchmark': 'pipeline_end_to_end',
+        'backend': 'mongod' if mongo_uri else 'memory',
+        'items': count,
+        'items_per_sec': round(count / elapsed),
+    }
+
+
+def bench_dedupe(count=20000):
+    """Cost of assigning near-duplicate clusters with an on-disk index."""
+    spider = make_spider()
+    documents = [record.to_document()
+                 for record in make_records(spider, count)]
+    with tempfile.TemporaryDirectory() as directory:
+        index = DuplicateIndex(os.path.join(directory, 'dedupe.sqlite'))
+        start = time.perf_counter()
+        for document in documents:
+            index.assign(document)
+        index.close()
+        elapsed = time.perf_counter() - start
+    return {
+        'benchmark': 'dedupe',
+        'items': count,
+        'us_per_item': round(elapsed / count * 1e6, 2),
+    }
+
+
+def check_async_acks(count=2000, page_size=25):
+    """
+    Passes records through AsyncJobbankPipeline.process_item and acks what
+    it returns, as the spider does on item_scraped. Raises AssertionError
+    unless every page reaches the checkpoint.
+    """
+    spider = make_spider()
+    records = make_records(spider, count)
+    pipeline = AsyncJobbankPipeline()
+    pipeline.spider = spider
+    pipeline.spool = None
+    pipeline.writer = AsyncBulkWriter(AsyncMemoryCollection())
+
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint = Checkpoint(os.path.join(directory, 'checkpoint.json'))
+        page_acks = PageAcks(checkpoint)
+        pages = [records[i:i + page_size]
+                 for i in range(0, count, page_size)]
+        for number, page in enumerate(pages, 1):
+            for record in page:
+                page_acks.track(SEARCH_URL, record)
+            page_acks.page_done(SEARCH_URL, number, page[-1].job_link)
+
+        async def feed():
+            for record in records:
+                page_acks.ack(await pipeline.process_item(record, spider))
+            await pipeline.writer.drain()
+
+        start = time.perf_counter()
+        asyncio.run(feed())
+        elapsed = time.perf_counter() - start
+        acked = checkpoint.pages(SEARCH_URL)
+    assert acked == len(pages), f'{acked} of {len(pages)} pages acked'
+    return {
+        'benchmark': 'async_pipeline_acks',
+        'items': count,
+        'pages': acked,
+        'items_per_sec': round(count / elapsed),
+    }
+
+
+def run(mongo_uri=None):
+    return [bench_validate_transform(), bench_dedupe(),
+            bench_end_to_end(mongo_uri=mongo_uri), check_async_acks()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongo-uri', help='Use a local mongod instead of '
+                        'the in-memory collection')
+    args = parser.parse_args()
+    print(json.dumps(run(args.mongo_uri), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Runs every benchmark and writes the results as JSON, optionally comparing
+them with the results of another commit.
+
+    python -m benchmarks.run --output bench.json [--compare previous.json]
+"""
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks import (details, httpengine, memory, parsing, pipeline,
+                        shards)
+
+# Metrics where a lower value is better; all others are throughputs
+LOWER_IS_BETTER = ('ms_per_page', 'us_per_item', 'seconds',
+                   'job_record_bytes', 'jobbank_item_bytes')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    """Identifies a result across runs by its name and parameters."""
+    return json.dumps({key: value for key, value in result.items()
+                       if isinstance(value, str) or key in (
+                           'articles', 'pages', 'items', 'count')},
+                      sort_keys=True)
+
+
+def compare(results, previous):
+    """Returns the relative change of every metric found in both runs."""
+    previous_by_key = {result_key(r): r for r in previous['results']}
+    changes = []
+    for result in results:
+        old = previous_by_key.get(result_key(result))
+        if old is None:
+            continue
+        for metric, value in result.items():
+            if metric.endswith(LOWER_IS_BETTER) or metric.endswith('_per_sec'):
+                if old.get(metric):
+                    changes.append({
+                        'benchmark': result['benchmark'],
+                        'key': result_key(result),
+                        'metric': metric,
+                        'previous': old[metric],
+                        'current': value,
+                        'change': round(value / old[metric] - 1, 3),
+                    })
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='File to write the results to')
+    parser.add_argument('--compare', help='Results of a previous run')
+    parser.add_argument('--mongo-uri', help='Run the pipeline benchmark '
+                        'against a local mongod, and the shard queue check '
+                        'with it')
+    parser.add_argument('--memory-count', type=int, default=100000)
+    args = parser.parse_args()
+
+    # Keep per-batch log lines out of the measurements
+    logging.disable(logging.INFO)
+
+    results = []
+    results += parsing.run()
+    results += details.run()
+    results += pipeline.run(args.mongo_uri)
+    results.append(memory.run(args.memory_count))
+    if args.mongo_uri:
+        results += shards.run(args.mongo_uri)
+    # Last, as it runs the reactor, which cannot be restarted
+    results += httpengine.run()
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report['comparison'] = compare(results, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Distributed shard queue: several node processes share the shards of one
+run through a local mongod. One node dies right after claiming a shard, so
+the others must claim it again once its lease expires; one shard takes
+longer than a lease, so its node must keep renewing it; and one shard is
+released once, as after a failed crawl. The run fails unless every shard is
+completed exactly once.
+
+    python -m benchmarks.shards [--mongo-uri mongodb://localhost:27017/]
+"""
+import argparse
+import json
+import multiprocessing
+import queue
+import time
+import uuid
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from scrapy.utils.project import get_project_settings
+
+from jobbank.shardqueue import ShardQueue
+
+DEFAULT_URI = 'mongodb://localhost:27017/'
+BENCHMARK_COLLECTION = 'benchmark_shards'
+
+LEASE_SECONDS = 2
+POLL_INTERVAL = 0.5
+MAX_ATTEMPTS = 3
+WORK_SECONDS = 0.1
+# Crawled for longer than a lease, so only the heartbeat keeps it
+SLOW_SHARD = 'shard-1'
+SLOW_SECONDS = LEASE_SECONDS * 2.5
+# Given back by the first node to claim it
+RELEASED_SHARD = 'shard-2'
+
+
+def shard_urls(count):
+    return [f'shard-{number}' for number in range(count)]
+
+
+def _collection(mongo_uri):
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    database = get_project_settings().get('MONGO_DATABASE')
+    return client, client[database][BENCHMARK_COLLECTION]
+
+
+def _shard_queue(collection, run_id):
+    return ShardQueue(collection, run_id, lease_seconds=LEASE_SECONDS,
+                      max_attempts=MAX_ATTEMPTS, poll_interval=POLL_INTERVAL)
+
+
+def crash_node(mongo_uri, run_id, claimed):
+    """Claims a shard and exits without finishing or releasing it."""
+    client, collection = _collection(mongo_uri)
+    shard_queue = _shard_queue(collection, run_id)
+    claimed.put((shard_queue.node_id, shard_queue.claim()))
+    client.close()
+
+
+def node(mongo_uri, run_id, done):
+    """Crawls shards until the run is finished, like a spider node."""
+    client, collection = _collection(mongo_uri)
+    shard_queue = _shard_queue(collection, run_id)
+    shard_queue.start()
+    try:
+        while True:
+            url = shard_queue.claim()
+            if url is None:
+                return
+            shard = collection.find_one({'run_id': run_id, 'url': url})
+            if url == RELEASED_SHARD and shard['attempts'] == 1:
+                shard_queue.release(url)
+                continue
+            time.sleep(SLOW_SECONDS if url == SLOW_SHARD else WORK_SECONDS)
+            shard_queue.complete(url)
+            done.put((shard_queue.node_id, url))
+    finally:
+        shard_queue.close()
+        client.close()
+
+
+def run_nodes(mongo_uri, nodes, urls):
+    """
+    Seeds a run with ``urls``, crashes a node on its first shard, then lets
+    ``nodes`` processes crawl the rest. Returns the run id, the crashed
+    node and its shard, and the (node, url) pairs completed.
+    """
+    run_id = f'benchmark-{uuid.uuid4().hex}'
+    client, collection = _collection(mongo_uri)
+    try:
+        _shard_queue(collection, run_id).seed(urls)
+    finally:
+        client.close()
+
+    context = multiprocessing.get_context('spawn')
+    claimed = context.Queue()
+    crashed = context.Process(target=crash_node,
+                              args=(mongo_uri, run_id, claimed))
+    crashed.start()
+    crashed_node, crashed_url = claimed.get(timeout=60)
+    crashed.join()
+
+    done = context.Queue()
+    workers = [context.Process(target=node, args=(mongo_uri, run_id, done))
+               for _ in range(nodes)]
+    for worker in workers:
+        worker.start()
+    completed = []
+    while len(completed) < len(urls) and any(
+            worker.is_alive() for worker in workers):
+        try:
+            completed.append(done.get(timeout=1))
+        except queue.Empty:
+            pass
+    for worker in workers:
+        worker.join()
+    while not done.empty():
+        completed.append(done.get())
+    return run_id, crashed_node, crashed_url, completed
+
+
+def check_run(collection, run_id, urls, crashed_node, crashed_url,
+              completed):
+    """
+    Raises AssertionError unless every shard was completed once, the
+    crashed node's shard by another node on its second attempt, the slow
+    shard on its first and the released shard on its second.
+    """
+    urls_done = [url for _, url in completed]
+    assert sorted(urls_done) == sorted(urls), (
+        f'{len(urls_done)} shards completed, {len(set(urls_done))} '
+        f'distinct, expected {len(urls)}')
+    shards = {shard['url']: shard
+              for shard in collection.find({'run_id': run_id})}
+    unfinished = [url for url, shard in shards.items()
+                  if shard['status'] != 'done']
+    assert not unfinished, f'Shards not done: {unfinished}'
+
+    expected_attempts = {url: 1 for url in urls}
+    expected_attempts[crashed_url] = 2
+    expected_attempts[RELEASED_SHARD] = 2
+    attempts = {url: shard['attempts'] for url, shard in shards.items()}
+    assert attempts == expected_attempts, (
+        f'Attempts {attempts}, expected {expected_attempts}')
+    assert shards[crashed_url]['owner'] != crashed_node, (
+        f'{crashed_url} was not claimed again after its lease expired')
+
+
+def run(mongo_uri=DEFAULT_URI, nodes=3, count=12):
+    urls = shard_urls(count)
+    start = time.perf_counter()
+    run_id, crashed_node, crashed_url, completed = run_nodes(
+        mongo_uri, nodes, urls)
+    elapsed = time.perf_counter() - start
+
+    client, collection = _collection(mongo_uri)
+    try:
+        check_run(collection, run_id, urls, crashed_node, crashed_url,
+                  completed)
+    finally:
+        collection.delete_many({'run_id': run_id})
+        client.close()
+    return [{
+        'benchmark': 'shard_queue',
+        'nodes': nodes,
+        'count': count,
+        'seconds': round(elapsed, 4),
+    }]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongo-uri', default=DEFAULT_URI,
+                        help='The local mongod the nodes share')
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--count', type=int, default=12,
+                        help='Shards in the run')
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        parser.exit(1, f'No mongod at {args.mongo_uri}: {e}\n')
+    finally:
+        client.close()
+    print(json.dumps(run(args.mongo_uri, args.nodes, args.count), indent=2))
+
+
+if __name__ == '__main__':
+    main()
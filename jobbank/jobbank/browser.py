@@ -0,0 +1,175 @@
+import logging
+import queue
+import threading
+
+
+def create_driver(settings):
+    """Starts a Chrome instance configured from the project settings."""
+    # Imported here as selenium.webdriver pulls in every browser binding,
+    # which slows down start up when no browser is needed
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    chrome_binary_location = settings.get('CHROME_BINARY_LOCATION')
+    chrome_driver_path = settings.get('CHROME_DRIVER_EXECUTABLE_PATH')
+
+    options = Options()
+    if chrome_binary_location:
+        options.binary_location = chrome_binary_location
+    for argument in settings.getlist('SELENIUM_DRIVER_ARGUMENTS'):
+        options.add_argument(argument)
+
+    lean = settings.getbool('BROWSER_LEAN_PROFILE')
+    if lean:
+        # Return from driver.get() once the DOM is ready instead of waiting
+        # for every subresource
+        options.page_load_strategy = settings.get(
+            'BROWSER_PAGE_LOAD_STRATEGY', 'eager')
+        options.add_argument('--disable-extensions')
+        options.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2})
+
+    service = Service(executable_path=chrome_driver_path)
+    driver = webdriver.Chrome(service=service, options=options)
+
+    blocked_urls = blocked_url_patterns(
+        settings.getlist('BROWSER_BLOCKED_URLS'))
+    if lean and blocked_urls:
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs',
+                                   {'urls': blocked_urls})
+        except Exception:
+            driver.quit()
+            raise
+    return driver
+
+
+def blocked_url_patterns(patterns):
+    """
+    Network.setBlockedURLs matches patterns against the whole URL, so
+    ``*.css`` misses ``app.css?v=3``. Adds a variant matching a query
+    string to every pattern that does not end with a wildcard.
+    """
+    expanded = []
+    for pattern in patterns:
+        expanded.append(pattern)
+        if not pattern.endswith('*'):
+            expanded.append(f'{pattern}?*')
+    return expanded
+
+
+def pool_from_settings(settings, logger=None):
+    """Returns a BrowserPool configured from the project settings."""
+    return BrowserPool(
+        lambda: create_driver(settings),
+        size=settings.getint('BROWSER_POOL_SIZE', 1),
+        recycle_after_pages=settings.getint('BROWSER_RECYCLE_AFTER_PAGES', 0),
+        recycle_heap_mb=settings.getint('BROWSER_RECYCLE_HEAP_MB', 0),
+        logger=logger,
+    )
+
+
+class BrowserPool:
+    """
+    Fixed-size pool of Chrome drivers shared by the shard workers.
+
+    Drivers are started on first use. A driver that crashed, served
+    ``recycle_after_pages`` result pages or whose JS heap grew past
+    ``recycle_heap_mb`` is quit and replaced on release. Workers on a long
+    search check ``due_for_recycling`` between pages and swap their driver
+    with ``recycle``.
+    """
+
+    def __init__(self, factory, size=1, recycle_after_pages=0,
+                 recycle_heap_mb=0, logger=None):
+        self.factory = factory
+        self.size = size
+        self.recycle_after_pages = recycle_after_pages
+        self.recycle_heap_mb = recycle_heap_mb
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.lock = threading.Lock()
+        self.idle = queue.Queue()
+        self.drivers = {}  # driver -> result pages served
+        for _ in range(size):
+            self.idle.put(None)  # A slot whose driver is not started yet
+        self.closed = False
+
+    def acquire(self):
+        driver = self.idle.get()
+        if driver is None:
+            try:
+                driver = self.factory()
+            except Exception:
+                self.idle.put(None)  # Give the slot back
+                raise
+            with self.lock:
+                self.drivers[driver] = 0
+        return driver
+
+    def warm(self, count=1):
+        """Starts up to ``count`` drivers ahead of the first acquire."""
+        drivers = [self.acquire() for _ in range(min(count, self.size))]
+        for driver in drivers:
+            self.release(driver)
+
+    def release(self, driver, pages=0, broken=False):
+        with self.lock:
+            served = self.drivers.get(driver, 0) + pages
+            if driver in self.drivers:  # Not already quit by close()
+                self.drivers[driver] = served
+
+        if broken or self.closed or self._needs_recycling(driver, served):
+            self._quit(driver)
+            driver = None
+        self.idle.put(driver)
+
+    def due_for_recycling(self, driver, pages=0):
+        """
+        True if ``driver`` should be replaced once it served ``pages`` more
+        result pages than released so far.
+        """
+        with self.lock:
+            served = self.drivers.get(driver, 0) + pages
+        return self._needs_recycling(driver, served)
+
+    def recycle(self, driver):
+        """Quits ``driver`` and returns a driver started in its place."""
+        self._quit(driver)
+        self.idle.put(None)
+        return self.acquire()
+
+    def _needs_recycling(self, driver, served):
+        if self.recycle_after_pages and served >= self.recycle_after_pages:
+            self.logger.info(f'Recycling browser after {served} pages')
+            return True
+        if not self.recycle_heap_mb:
+            return False
+        try:
+            heap = driver.execute_script(
+                'return performance.memory ? '
+                'performance.memory.usedJSHeapSize : 0;')
+        except Exception:
+            return True
+        if heap > self.recycle_heap_mb * 1024 * 1024:
+            self.logger.info(
+                f'Recycling browser using {heap // (1024 * 1024)} MB of heap')
+            return True
+        return False
+
+    def _quit(self, driver):
+        with self.lock:
+            self.drivers.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception as e:
+            self.logger.error(f'Error closing the driver: {e}')
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            drivers = list(self.drivers)
+        for driver in drivers:
+            self._quit(driver)
@@ -0,0 +1,89 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+MANIFEST = 'manifest.jsonl'
+
+
+class PageArchive:
+    """
+    Content-addressed archive of the result pages the spider parsed, so
+    they can be parsed again offline (see replay.py).
+
+    Each page is stored once, gzipped, under ``objects/`` and named after
+    the digest of its markup. ``manifest.jsonl`` records every capture in
+    order: ``{digest, url, page, captured_at}``. The manifest is only opened
+    once the first page is added, so reading an archive never writes to it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.manifest = None
+        self.count = 0
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2],
+                            f'{digest}.html.gz')
+
+    def add(self, html, url, page=None):
+        """Stores ``html`` unless an identical page is stored; returns its digest."""
+        data = html.encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name, so a crash never leaves a
+            # truncated page behind. Concurrent writers of the same page
+            # write identical files.
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with gzip.open(tmp_path, 'wb', compresslevel=5) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        record = json.dumps({
+            'digest': digest,
+            'url': url,
+            'page': page,
+            'captured_at': datetime.now(timezone.utc).isoformat(),
+        })
+        with self.lock:
+            if self.manifest is None:
+                os.makedirs(self.path, exist_ok=True)
+                self.manifest = open(os.path.join(self.path, MANIFEST), 'a',
+                                     encoding='utf-8')
+            self.manifest.write(record + '\n')
+            self.manifest.flush()
+            self.count += 1
+        return digest
+
+    def entries(self, since=None):
+        """
+        Yields the manifest records in capture order, only those captured
+        at or after ``since`` (an ISO 8601 string) if given.
+        """
+        path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line of an interrupted capture
+                if since is None or entry['captured_at'] >= since:
+                    yield entry
+
+    def read(self, digest):
+        """Returns the markup of the page stored as ``digest``."""
+        with gzip.open(self._object_path(digest), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def close(self):
+        with self.lock:
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
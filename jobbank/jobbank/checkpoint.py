@@ -0,0 +1,225 @@
+import collections
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from jobbank.items import JobDetailItem, JobRecord, JobbankItem
+
+
+def write_atomic(path, data):
+    """
+    Replaces the file at ``path`` with ``data`` (str or bytes). It is
+    written to a temporary file first, so a crash never leaves a truncated
+    file behind.
+    """
+    tmp_path = f'{path}.tmp'
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """
+    Crawl progress per search shard: result pages loaded, the last posting
+    parsed and whether the shard is finished.
+
+    Progress is kept in memory and written to ``path`` at most every
+    ``interval`` seconds. The file is removed once a crawl finishes, so a
+    checkpoint found at start up belongs to an interrupted crawl.
+    """
+
+    def __init__(self, path, interval=10):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last_save = time.monotonic()
+        self.shards = {}
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.shards = json.load(f).get('shards', {})
+
+    def pages(self, url):
+        """Result pages already crawled for ``url`` by a previous run."""
+        return self.shards.get(url, {}).get('pages', 0)
+
+    def is_done(self, url):
+        return self.shards.get(url, {}).get('done', False)
+
+    def update(self, url, pages, last_link=None):
+        with self.lock:
+            shard = self.shards.setdefault(url, {})
+            shard['pages'] = pages
+            if last_link:
+                shard['last_link'] = last_link
+        self.save_if_due()
+
+    def done(self, url):
+        with self.lock:
+            self.shards.setdefault(url, {})['done'] = True
+        self.save_if_due()
+
+    def save_if_due(self):
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            self.last_save = time.monotonic()
+            data = json.dumps({
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+                'shards': self.shards,
+            }, indent=1)
+        write_atomic(self.path, data)
+
+    def clear(self):
+        with self.lock:
+            self.shards = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class PageAcks:
+    """
+    Advances a Checkpoint once the items of a result page were handed to
+    the pipeline, rather than once the page was parsed, so an interrupted
+    crawl never skips items still waiting to be spooled.
+
+    The pages of a shard are recorded in order: a page only once its own
+    items and those of every page before it were scraped, dropped or
+    failed. Items are matched by identity, so pipelines must pass on the
+    object they got. Only used from the reactor thread.
+    """
+
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.shards = {}  # url -> deque of pages, the last one may be open
+        # id(item) -> (item, page); holding the item keeps its id unique
+        self.items = {}
+
+    def _open_page(self, url):
+        pages = self.shards.setdefault(url, collections.deque())
+        if not pages or pages[-1]['sealed']:
+            pages.append({'url': url, 'items': set(), 'sealed': False,
+                          'pages': 0, 'last_link': None, 'done': False})
+        return pages[-1]
+
+    def track(self, url, item):
+        """Adds ``item`` to the page of ``url`` being parsed."""
+        page = self._open_page(url)
+        page['items'].add(id(item))
+        self.items[id(item)] = (item, page)
+
+    def page_done(self, url, pages, last_link=None):
+        """Closes the page of ``url``, the ``pages``-th of the search."""
+        self._open_page(url).update(sealed=True, pages=pages,
+                                    last_link=last_link)
+        self._advance(url)
+
+    def shard_done(self, url):
+        self._open_page(url).update(sealed=True, done=True)
+        self._advance(url)
+
+    def ack(self, item):
+        """Records that the pipeline got ``item``."""
+        tracked, page = self.items.get(id(item), (None, None))
+        if tracked is not item:
+            return
+        del self.items[id(item)]
+        page['items'].discard(id(item))
+        self._advance(page['url'])
+
+    def _advance(self, url):
+        pages = self.shards[url]
+        while pages and pages[0]['sealed'] and not pages[0]['items']:
+            page = pages.popleft()
+            if page['done']:
+                self.checkpoint.done(url)
+            else:
+                self.checkpoint.update(url, page['pages'], page['last_link'])
+        if not pages:
+            del self.shards[url]
+
+
+class Spool:
+    """
+    Append-only JSON lines file of the items handed to the pipeline.
+
+    Every item is appended before it is queued for writing, and the file is
+    truncated whenever everything appended so far is stored, or rewritten
+    with only the items whose write is still outstanding (see ``keep``).
+    Items found in the spool at start up were lost by a crash and are
+    replayed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.count = 0
+        self.file = None
+
+    def replay(self):
+        """Returns the items left by the previous run and empties the spool."""
+        items = []
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn last line from the crash
+                    items.append(_load_item(record))
+        self.file = open(self.path, 'w', encoding='utf-8')
+        return items
+
+    def append(self, item):
+        line = json.dumps(_dump_item(item), ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+            self.count += 1
+
+    def truncate(self):
+        with self.lock:
+            if self.count:
+                self.file.seek(0)
+                self.file.truncate()
+                self.count = 0
+
+    def keep(self, job_links):
+        """Drops every spooled item whose job link is not in ``job_links``."""
+        if not job_links:
+            return self.truncate()
+        with self.lock:
+            with open(self.path, encoding='utf-8') as f:
+                kept = [line for line in f
+                        if json.loads(line)['item']['job_link'] in job_links]
+            if len(kept) == self.count:
+                return
+            self.file.close()
+            write_atomic(self.path, ''.join(kept))
+            self.file = open(self.path, 'a', encoding='utf-8')
+            self.count = len(kept)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def _dump_item(item):
+    if isinstance(item, JobRecord):
+        return {'kind': 'posting', 'item': item.to_document()}
+    kind = 'detail' if isinstance(item, JobDetailItem) else 'posting'
+    return {'kind': kind, 'item': dict(item)}
+
+
+def _load_item(record):
+    if record['kind'] == 'detail':
+        return JobDetailItem(**record['item'])
+    return JobbankItem(**record['item'])
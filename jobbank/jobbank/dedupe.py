@@ -0,0 +1,283 @@
+# dedupe.py
+"""
+Near-duplicate detection for postings reposted under a new job link.
+
+Each posting gets a MinHash signature of its title and salary, split into
+LSH bands. A band key combines the band's hash values with the normalized
+business and location, so only postings of the same employer at the same
+place can share a bucket. Postings sharing any bucket belong to the same
+cluster. The buckets live in SQLite, so assigning a posting to a cluster is
+a handful of primary key lookups whatever the size of the collection.
+
+The index is a local file, so clusters are only assigned by single-node
+crawls; the pipeline leaves them out of distributed runs (--run-id). Run as
+a script to assign clusters to the postings stored without one, e.g. after
+a distributed run:
+
+    python jobbank/dedupe.py [--rebuild]
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+from collections import Counter
+
+from scrapy.utils.project import get_project_settings
+
+from jobbank.schema import update_each
+
+logger = logging.getLogger(__name__)
+
+# Version of the shingles, signatures and tables, stored with the index so
+# a change rebuilds it
+SIGNATURE_VERSION = 2
+
+NON_WORD_RE = re.compile(r'[^\w\s]+')
+
+
+def normalize(text):
+    """Lowercases ``text`` and drops punctuation and extra whitespace."""
+    if not text:
+        return ''
+    return ' '.join(NON_WORD_RE.sub(' ', text.lower()).split())
+
+
+def shingles(item):
+    """
+    Character trigrams of the title plus the salary's words. Titles are
+    short, so trigrams keep small edits ("Cook" / "Cooks") similar.
+    """
+    title = f" {normalize(item.get('title'))} "
+    grams = {title[i:i + 3] for i in range(len(title) - 2)}
+    grams.update(f'salary:{word}'
+                 for word in normalize(item.get('salary')).split())
+    return grams
+
+
+def _hash64(text):
+    return int.from_bytes(
+        hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _signed(value):
+    """Maps an unsigned 64-bit value to the range of an SQLite INTEGER."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class DuplicateIndex:
+    """
+    Persistent LSH index assigning postings to clusters of near-duplicates.
+
+    With ``bands`` bands of ``rows`` MinHash values, two postings sharing
+    the same business and location end up in the same cluster with a
+    probability of 1 - (1 - s ** rows) ** bands, s being the Jaccard
+    similarity of their shingles: about 0.96 for s = 0.8 and 0.22 for
+    s = 0.5 with the defaults.
+
+    Cluster ids are derived from the job link of the cluster's first
+    posting. Every posting's bucket keys are kept, and buckets count the
+    postings in them, so a posting whose title or salary changed leaves
+    the buckets it no longer belongs to. Assignments are committed by
+    ``save``, which the pipeline calls before writing each batch, so no
+    stored cluster id is missing from the index after a crash.
+    """
+
+    def __init__(self, path, bands=8, rows=5):
+        self.path = path
+        self.bands = bands
+        self.rows = rows
+        self.lock = threading.Lock()
+        # One 32-bit hash per MinHash value
+        self.values = struct.Struct(f'<{bands * rows}I')
+        # The bucket keys of a posting
+        self.keys = struct.Struct(f'<{bands}q')
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)')
+        self._check_layout()
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets (key INTEGER PRIMARY KEY, '
+            'cluster_id INTEGER NOT NULL, postings INTEGER NOT NULL)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS postings (id INTEGER PRIMARY KEY, '
+            'keys BLOB NOT NULL, cluster_id INTEGER NOT NULL)')
+        self.connection.commit()
+
+    def _check_layout(self):
+        # Buckets built with other band settings never match new keys
+        layout = f'{self.bands}x{self.rows}/{SIGNATURE_VERSION}'
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE name = 'layout'").fetchone()
+        if row is not None and row[0] != layout:
+            logger.warning(f'Rebuilding {self.path}: it was built for '
+                           f'{row[0]} bands, not {layout}')
+            self.connection.execute('DROP TABLE IF EXISTS buckets')
+            self.connection.execute('DROP TABLE IF EXISTS postings')
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('layout', ?)", (layout,))
+
+    def __len__(self):
+        """Number of buckets in the index."""
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM buckets').fetchone()[0]
+
+    def signature(self, item):
+        """
+        The MinHash signature of ``item``. The SHAKE-128 output of a shingle
+        gives all of its hash values in one call, and the minimums are
+        taken column-wise.
+        """
+        size = self.values.size
+        hashes = [self.values.unpack(
+            hashlib.shake_128(gram.encode('utf-8')).digest(size))
+            for gram in shingles(item) or ('',)]
+        return list(map(min, zip(*hashes)))
+
+    def band_keys(self, item):
+        """The bucket of ``item`` in every band."""
+        block = (f"{normalize(item.get('business'))}|"
+                 f"{normalize(item.get('location'))}").encode('utf-8')
+        signature = self.values.pack(*self.signature(item))
+        width = self.rows * 4
+        keys = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(block, digest_size=8,
+                                     salt=band.to_bytes(8, 'big'))
+            digest.update(signature[band * width:(band + 1) * width])
+            keys.append(_signed(int.from_bytes(digest.digest(), 'big')))
+        return keys
+
+    def assign(self, item):
+        """
+        Returns the cluster id of ``item``, starting a new cluster if no
+        similar posting was indexed, and indexes it.
+        """
+        keys = self.band_keys(item)
+        packed = self.keys.pack(*keys)
+        posting = _signed(_hash64(item['job_link']))
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT keys, cluster_id FROM postings WHERE id = ?',
+                (posting,)).fetchone()
+            if row is not None:
+                if row[0] == packed:
+                    return _cluster_name(row[1])
+                self._leave(self.keys.unpack(row[0]))
+
+            placeholders = ', '.join('?' * len(keys))
+            clusters = Counter(cluster_id for cluster_id, in
+                               self.connection.execute(
+                                   'SELECT cluster_id FROM buckets '
+                                   f'WHERE key IN ({placeholders})', keys))
+            if clusters:
+                # The cluster sharing the most bands
+                cluster_id = max(clusters.items(),
+                                 key=lambda entry: (entry[1], -entry[0]))[0]
+            elif row is None:
+                cluster_id = posting
+            else:
+                # Its old cluster may live on without it
+                cluster_id = _signed(_hash64(
+                    f"{item['job_link']} {packed.hex()}"))
+            self.connection.executemany(
+                'INSERT INTO buckets VALUES (?, ?, 1) ON CONFLICT (key) '
+                'DO UPDATE SET postings = postings + 1',
+                [(key, cluster_id) for key in keys])
+            self.connection.execute(
+                'INSERT OR REPLACE INTO postings VALUES (?, ?, ?)',
+                (posting, packed, cluster_id))
+        return _cluster_name(cluster_id)
+
+    def _leave(self, keys):
+        """Takes a posting out of the buckets of ``keys``."""
+        self.connection.executemany(
+            'UPDATE buckets SET postings = postings - 1 WHERE key = ?',
+            [(key,) for key in keys])
+        self.connection.execute(
+            'DELETE FROM buckets WHERE postings <= 0 AND key IN '
+            f"({', '.join('?' * len(keys))})", keys)
+
+    def save(self):
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+def _cluster_name(cluster_id):
+    return f'{cluster_id & 0xFFFFFFFFFFFFFFFF:016x}'
+
+
+def index_from_settings(settings):
+    """Returns the DuplicateIndex configured in ``settings``, or None."""
+    path = settings.get('JOBBANK_DEDUPE_INDEX_PATH')
+    if not path:
+        return None
+    return DuplicateIndex(
+        path,
+        bands=settings.getint('JOBBANK_DEDUPE_BANDS', 8),
+        rows=settings.getint('JOBBANK_DEDUPE_ROWS', 5),
+    )
+
+
+def backfill_clusters(collection, index, batch_size=1000):
+    """
+    Assigns a cluster to the postings stored without one, oldest first so
+    clusters are named after their first posting. Returns the number of
+    postings updated.
+    """
+    cursor = collection.find(
+        {'cluster_id': {'$exists': False}},
+        {'job_link': 1, 'title': 1, 'business': 1, 'location': 1,
+         'salary': 1},
+        batch_size=batch_size,
+    ).sort('first_seen', 1)
+    # The index is committed before the cluster ids are stored
+    return update_each(
+        collection, cursor,
+        lambda document: {'cluster_id': index.assign(document)}, batch_size,
+        before_write=index.save)
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Assign near-duplicate clusters to stored postings.')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Start from an empty index and reassign every '
+                             'posting')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    path = settings.get('JOBBANK_DEDUPE_INDEX_PATH')
+    if not path:
+        parser.error('JOBBANK_DEDUPE_INDEX_PATH is not set')
+    if args.rebuild:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    client = MongoClient(settings.get('MONGO_URI'))
+    index = index_from_settings(settings)
+    try:
+        collection = client[settings.get('MONGO_DATABASE')][
+            settings.get('MONGO_COLLECTION')]
+        if args.rebuild:
+            collection.update_many({}, {'$unset': {'cluster_id': ''}})
+        updated = backfill_clusters(collection, index)
+        logger.info(f'Assigned clusters to {updated} postings')
+    finally:
+        index.close()
+        client.close()
@@ -0,0 +1,274 @@
+# export.py
+"""
+Exports the postings collection as gzipped JSON lines and/or Parquet files
+partitioned by posting date:
+
+    <output>/date=2024-06-01/part-20240602T010000.jsonl.gz
+    <output>/date=2024-06-01/part-20240602T010000.parquet
+
+Documents are streamed from a server-side cursor sorted by posting date, so
+only one partition is open at a time and memory use does not depend on the
+size of the collection. With --incremental only documents updated since the
+previous export (the watermark kept in <output>/_watermark.json) are
+exported; consumers keep the latest version of each job_link.
+
+``updated_at`` is set by the server when a write is applied. Writes still in
+flight while the export runs can commit with an earlier time than documents
+already read, so each incremental export stops at ``--margin`` seconds
+before it started and the next one carries on from there. A full export
+takes every document, whether or not it has ``updated_at``.
+
+    python jobbank/export.py --output exports --format both --incremental
+"""
+import argparse
+import collections
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, MongoClient
+from scrapy.utils.project import get_project_settings
+
+from jobbank.checkpoint import write_atomic
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_FILE = '_watermark.json'
+UNKNOWN_DATE = 'unknown'
+# Seconds before the start of an export that it stops at
+DEFAULT_MARGIN = 300
+
+# Columns of the Parquet files and their types
+PARQUET_COLUMNS = (
+    ('job_link', 'string'),
+    ('title', 'string'),
+    ('date', 'string'),
+    ('posted_at', 'timestamp'),
+    ('business', 'string'),
+    ('location', 'string'),
+    ('salary', 'string'),
+    ('salary_min', 'float'),
+    ('salary_max', 'float'),
+    ('salary_period', 'string'),
+    ('salary_annual_min', 'float'),
+    ('salary_annual_max', 'float'),
+    ('city', 'string'),
+    ('province', 'string'),
+    ('cluster_id', 'string'),
+    ('source', 'string'),
+    ('country', 'string'),
+    ('description', 'string'),
+    ('noc_code', 'string'),
+    ('hours', 'string'),
+    ('vacancies', 'int'),
+    ('employment_terms', 'string'),
+    ('content_hash', 'string'),
+    ('first_seen', 'timestamp'),
+    ('last_seen', 'timestamp'),
+    ('updated_at', 'timestamp'),
+)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class JsonlPartitions:
+    """
+    One gzipped JSON lines file per posting date. Only the partition being
+    written is open; it is closed when a document of another date comes.
+    """
+
+    def __init__(self, output, part):
+        self.output = output
+        self.part = part
+        self.date = None
+        self.file = None
+
+    def write(self, date, document):
+        if date != self.date:
+            self.close()
+            path = _partition_path(self.output, date,
+                                   f'{self.part}.jsonl.gz')
+            # Appends if documents of this date came earlier
+            self.file = gzip.open(path, 'at', encoding='utf-8')
+            self.date = date
+        self.file.write(json.dumps(document, ensure_ascii=False,
+                                   default=_json_default))
+        self.file.write('\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.date = None
+
+
+class ParquetPartitions:
+    """
+    One Parquet file per posting date, written one row group of up to
+    ``row_group_size`` rows at a time. Only the partition being written is
+    open; it is closed when a document of another date comes. Parquet
+    files cannot be appended to, so a date coming back gets another file.
+    """
+
+    def __init__(self, output, part, row_group_size=10000):
+        if pa is None:
+            raise RuntimeError('Parquet export requires pyarrow')
+        self.output = output
+        self.part = part
+        self.row_group_size = row_group_size
+        types = {'string': pa.string(), 'int': pa.int64(),
+                 'float': pa.float64(),
+                 'timestamp': pa.timestamp('ms', tz='UTC')}
+        self.schema = pa.schema(
+            [(name, types[kind]) for name, kind in PARQUET_COLUMNS])
+        self.date = None
+        self.writer = None
+        self.rows = []
+        # Files written so far per date
+        self.files = collections.Counter()
+
+    def write(self, date, document):
+        if date != self.date:
+            self.close()
+            self.date = date
+        self.rows.append({name: document.get(name)
+                          for name, _ in PARQUET_COLUMNS})
+        if len(self.rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+        if self.writer is None:
+            files = self.files[self.date]
+            self.files[self.date] += 1
+            suffix = f'-{files}' if files else ''
+            path = _partition_path(self.output, self.date,
+                                   f'{self.part}{suffix}.parquet')
+            self.writer = pq.ParquetWriter(path, self.schema,
+                                           compression='zstd')
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.date = None
+
+
+def _partition_path(output, date, filename):
+    directory = os.path.join(output, f'date={date}')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def read_watermark(output):
+    path = os.path.join(output, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return datetime.fromisoformat(json.load(f)['updated_at'])
+
+
+def write_watermark(output, updated_at):
+    write_atomic(os.path.join(output, WATERMARK_FILE),
+                 json.dumps({'updated_at': updated_at.isoformat()}))
+
+
+def export(collection, output, formats=('jsonl',), since=None, until=None,
+           batch_size=1000):
+    """
+    Streams the documents of ``collection`` updated after ``since`` and up
+    to ``until`` (without bound if None) into ``output``. Returns the
+    number of documents exported.
+    """
+    os.makedirs(output, exist_ok=True)
+    part = 'part-' + datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    sinks = []
+    if 'jsonl' in formats:
+        sinks.append(JsonlPartitions(output, part))
+    if 'parquet' in formats:
+        sinks.append(ParquetPartitions(output, part))
+
+    updated_at = {}
+    if since is not None:
+        updated_at['$gt'] = since
+    if until is not None:
+        updated_at['$lte'] = until
+    query = {'updated_at': updated_at} if updated_at else {}
+    count = 0
+    # Sorted on the posted_at index, so partitions are written one by one
+    cursor = collection.find(query, {'_id': 0}, batch_size=batch_size,
+                             sort=[('posted_at', ASCENDING)],
+                             allow_disk_use=True)
+    try:
+        for document in cursor:
+            date = document.get('date') or UNKNOWN_DATE
+            for sink in sinks:
+                sink.write(date, document)
+            count += 1
+    finally:
+        cursor.close()
+        for sink in sinks:
+            sink.close()
+    return count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Export the postings collection.')
+    parser.add_argument('--output', default='exports',
+                        help='Directory of the partitioned export')
+    parser.add_argument('--format', choices=['jsonl', 'parquet', 'both'],
+                        default='jsonl')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only export documents updated since the '
+                             'previous export')
+    parser.add_argument('--margin', type=float, default=DEFAULT_MARGIN,
+                        help='With --incremental, only export documents '
+                             'updated at least this many seconds ago; later '
+                             'ones go to the next export')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Documents fetched per cursor batch')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    settings = get_project_settings()
+
+    formats = ('jsonl', 'parquet') if args.format == 'both' else (args.format,)
+    since = read_watermark(args.output) if args.incremental else None
+    until = datetime.now(timezone.utc) - timedelta(seconds=args.margin)
+    # A full export takes every document, including those stored before
+    # updated_at existed; only the incremental window is bounded
+    window = (since, until) if args.incremental else (None, None)
+
+    client = MongoClient(settings.get('MONGO_URI'))
+    try:
+        collection = client[settings.get('MONGO_DATABASE')][
+            settings.get('MONGO_COLLECTION')]
+        count = export(collection, args.output, formats, *window,
+                       args.batch_size)
+    finally:
+        client.close()
+
+    # Everything updated up to the cutoff is exported now
+    write_watermark(args.output, until)
+    logger.info(f'Exported {count} postings to {args.output}'
+                + (f' (changed since {since.isoformat()})' if since else ''))
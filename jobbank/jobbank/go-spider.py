@@ -1,33 +1,146 @@
 # go-spider.py
+import argparse
 import subprocess
+import sys
+import threading
+import time
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from pymongo.uri_parser import parse_uri
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
+from jobbank.browser import pool_from_settings
 from jobbank.spiders.jobbank_spider import JobbankSpider
-import time
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def log(message):
+    # Scrapy's logging is only configured once the crawl starts
+    print(f'[go-spider] {message}', file=sys.stderr)
+
+
+def mongodb_ready(uri, timeout):
+    """Returns True if MongoDB answers a ping within ``timeout`` seconds."""
+    client = MongoClient(uri, serverSelectionTimeoutMS=int(timeout * 1000))
+    try:
+        client.admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+def redact(uri):
+    """Returns ``uri`` without the credentials, for messages."""
+    if not uri:
+        return uri
+    scheme, separator, rest = uri.partition('://')
+    hosts, slash, path = rest.partition('/')
+    return f"{scheme}{separator}{hosts.rpartition('@')[2]}{slash}{path}"
+
+
+def is_local(uri):
+    if not uri:
+        return True  # MongoClient defaults to localhost
+    try:
+        hosts = [host for host, _ in parse_uri(uri)['nodelist']]
+    except (PyMongoError, ValueError):
+        return False
+    return all(host in LOCAL_HOSTS for host in hosts)
+
 
 def start_mongodb():
-    # Start MongoDB in the background
-    subprocess.Popen(["mongod"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # Start MongoDB in the background. Its output is discarded rather than
+    # piped, as an unread pipe eventually blocks mongod.
+    return subprocess.Popen(["mongod"], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+
+def ensure_mongodb(uri, timeout):
+    """
+    Returns once MongoDB answers a ping, starting a local mongod if none is
+    running. A remote MongoDB, e.g. a container still starting, is waited
+    for. Exits if it is not ready within ``timeout`` seconds.
+    """
+    start = time.monotonic()
+    if mongodb_ready(uri, 0.5):
+        log('Using the running MongoDB')
+        return
+
+    mongod = None
+    if is_local(uri):
+        log('Starting mongod')
+        mongod = start_mongodb()
+    else:
+        log(f'Waiting for MongoDB at {redact(uri)}')
+    while time.monotonic() - start < timeout:
+        if mongod is not None and mongod.poll() is not None:
+            sys.exit(f'mongod exited with code {mongod.returncode}; '
+                     'run it by hand to see why')
+        if mongodb_ready(uri, 0.5):
+            log(f'MongoDB ready after {time.monotonic() - start:.1f} s')
+            return
+    if mongod is not None:
+        mongod.terminate()
+    sys.exit(f'MongoDB at {redact(uri) or "localhost"} did not answer a '
+             f'ping within {timeout} s')
 
-def wait_for_mongodb():
-    # Wait for MongoDB to start up
-    time.sleep(10)  # Adjust this as needed based on your system
+
+def warm_browser(browser_pool):
+    try:
+        browser_pool.warm()
+    except Exception as e:
+        # The spider retries when it acquires a browser
+        log(f'Could not start Chrome: {e}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the Job Bank crawl.')
+    parser.add_argument(
+        '--engine', choices=['selenium', 'http'],
+        help='Crawl engine (defaults to the JOBBANK_ENGINE setting)')
+    parser.add_argument(
+        '--run-id',
+        help='Join a distributed crawl: every node started with the same '
+             'run id shares the shards of the run')
+    parser.add_argument(
+        '--mongo-timeout', type=float, default=30,
+        help='Seconds to wait for MongoDB to answer before giving up')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    # Start MongoDB
-    start_mongodb()
-    
-    # Wait for MongoDB to be fully up and running
-    wait_for_mongodb()
+    args = parse_args()
 
     # Get Scrapy settings
     settings = get_project_settings()
+    engine = args.engine or settings.get('JOBBANK_ENGINE', 'selenium')
+
+    # Start Chrome while waiting for MongoDB
+    browser_pool = None
+    if engine == 'selenium':
+        browser_pool = pool_from_settings(settings)
+        browser_thread = threading.Thread(target=warm_browser,
+                                          args=(browser_pool,))
+        browser_thread.daemon = True
+        browser_thread.start()
+
+    # Wait for MongoDB to be up, starting it if needed
+    try:
+        ensure_mongodb(settings.get('MONGO_URI'), args.mongo_timeout)
+    except SystemExit:
+        if browser_pool is not None:
+            browser_thread.join()
+            browser_pool.close()
+        raise
 
     # Create a CrawlerProcess with the settings
     process = CrawlerProcess(settings)
 
     # Run the JobbankSpider
-    process.crawl(JobbankSpider)
+    process.crawl(JobbankSpider, engine=args.engine, run_id=args.run_id,
+                  browser_pool=browser_pool)
 
     # Start the crawling process
     process.start()
@@ -0,0 +1,92 @@
+import pickle
+import queue
+import tempfile
+import threading
+from collections import deque
+
+
+class SpillQueue(queue.Queue):
+    """
+    FIFO queue between the spider and the writer threads that keeps at most
+    ``memory_items`` entries in memory and spills the rest to a temporary
+    file, so memory stays flat however far the writer falls behind.
+
+    Once ``high_watermark`` entries are waiting the queue is paused:
+    ``wait_for_room`` blocks producers until it drains to ``low_watermark``.
+    """
+
+    def __init__(self, memory_items=10000, high_watermark=5000,
+                 low_watermark=1000, spill_dir=None):
+        self.memory_items = memory_items
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.spill_dir = spill_dir
+        super().__init__()
+        self.room = threading.Condition(self.mutex)
+        self.paused = False
+
+    # The queue.Queue hooks below are called with self.mutex held
+
+    def _init(self, maxsize):
+        self.memory = deque()
+        self.spill_file = None
+        self.spilled = 0
+        self.read_pos = 0
+        self.write_pos = 0
+
+    def _qsize(self):
+        return len(self.memory) + self.spilled
+
+    def _put(self, entry):
+        # Once entries are on disk, newer ones follow them there to keep
+        # the order
+        if self.spilled or len(self.memory) >= self.memory_items:
+            self._spill(entry)
+        else:
+            self.memory.append(entry)
+        if self._qsize() >= self.high_watermark:
+            self.paused = True
+
+    def _get(self):
+        entry = self.memory.popleft() if self.memory else self._unspill()
+        if self.paused and self._qsize() <= self.low_watermark:
+            self.paused = False
+            self.room.notify_all()
+        return entry
+
+    def _spill(self, entry):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(
+                prefix='jobbank-spill-', dir=self.spill_dir)
+        self.spill_file.seek(self.write_pos)
+        pickle.dump(entry, self.spill_file, pickle.HIGHEST_PROTOCOL)
+        self.write_pos = self.spill_file.tell()
+        self.spilled += 1
+
+    def _unspill(self):
+        self.spill_file.seek(self.read_pos)
+        entry = pickle.load(self.spill_file)
+        self.read_pos = self.spill_file.tell()
+        self.spilled -= 1
+        if not self.spilled:
+            # Drained: reuse the file from the start
+            self.spill_file.seek(0)
+            self.spill_file.truncate()
+            self.read_pos = self.write_pos = 0
+        return entry
+
+    def wait_for_room(self, timeout=None):
+        """
+        Waits up to ``timeout`` seconds for the queue to be below its
+        watermarks. Returns False if it is still paused.
+        """
+        with self.room:
+            if self.paused:
+                self.room.wait(timeout)
+            return not self.paused
+
+    def close(self):
+        with self.mutex:
+            if self.spill_file is not None:
+                self.spill_file.close()  # Deletes the temporary file
+                self.spill_file = None
@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+@contextmanager
+def timed(spider, stage):
+    """Records the time spent in the block as ``stage`` if metrics are on."""
+    metrics = getattr(spider, 'metrics', None)
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(stage, time.perf_counter() - start)
+
+
+class JobbankMetrics:
+    """
+    Per-stage latency histograms and queue gauges for the crawl.
+
+    Stages are recorded into the stats collector as they happen
+    (``stage/<name>/count``, ``seconds_total`` and ``seconds_max``), served
+    in the Prometheus text format on METRICS_HOST:METRICS_PORT while the
+    crawl runs, and summarized in the log when the spider closes.
+    """
+
+    def __init__(self, stats, host='127.0.0.1', port=0, sample_interval=5):
+        self.stats = stats
+        self.host = host
+        self.port = port
+        self.sample_interval = sample_interval
+
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.gauges = {}
+        self.spider = None
+        self.server = None
+        self.sampler = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        ext = cls(
+            crawler.stats,
+            host=settings.get('METRICS_HOST', '127.0.0.1'),
+            port=settings.getint('METRICS_PORT', 0),
+            sample_interval=settings.getfloat('METRICS_SAMPLE_INTERVAL', 5),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        # Attach early when possible so pipelines opened before
+        # spider_opened are measured from the first item
+        if getattr(crawler, 'spider', None) is not None:
+            crawler.spider.metrics = ext
+        return ext
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            self.stats.inc_value(f'stage/{stage}/count')
+            self.stats.inc_value(f'stage/{stage}/seconds_total', seconds)
+            self.stats.max_value(f'stage/{stage}/seconds_max', seconds)
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+            self.stats.set_value(f'gauge/{name}', value)
+            self.stats.max_value(f'gauge/{name}_max', value)
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        spider.metrics = self
+
+        self.sampler = task.LoopingCall(self._sample_queues)
+        self.sampler.start(self.sample_interval)
+
+        if self.port:
+            try:
+                self.server = ThreadingHTTPServer(
+                    (self.host, self.port), _handler(self))
+            except OSError as e:
+                # Most likely another crawl on the same host holds the port
+                spider.logger.warning(
+                    f'Cannot serve metrics on {self.host}:{self.port} ({e}), '
+                    'using a free port instead')
+                self.server = ThreadingHTTPServer(
+                    (self.host, 0), _handler(self))
+            port = self.server.server_address[1]
+            self.stats.set_value('metrics/port', port)
+            server_thread = threading.Thread(target=self.server.serve_forever)
+            server_thread.daemon = True
+            server_thread.start()
+            spider.logger.info(
+                f'Serving metrics on http://{self.host}:{port}/metrics')
+
+    def _sample_queues(self):
+        item_queue = getattr(self.spider, 'item_queue', None)
+        if item_queue is not None:
+            self.gauge('item_queue_depth', item_queue.qsize())
+            spilled = getattr(item_queue, 'spilled', None)
+            if spilled is not None:
+                self.gauge('item_queue_spilled', spilled)
+
+    def spider_closed(self, spider):
+        if self.sampler is not None and self.sampler.running:
+            self.sampler.stop()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                spider.logger.info(
+                    f'Stage {stage}: {histogram.count} calls, '
+                    f'{histogram.sum:.2f} s total, '
+                    f'mean {histogram.sum / histogram.count * 1000:.1f} ms, '
+                    f'p50 <= {histogram.quantile(0.5) * 1000:g} ms, '
+                    f'p95 <= {histogram.quantile(0.95) * 1000:g} ms, '
+                    f'max {histogram.max * 1000:.1f} ms')
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = ['# TYPE jobbank_stage_seconds histogram']
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(
+                        f'jobbank_stage_seconds_bucket{{stage="{stage}",'
+                        f'le="{bound}"}} {count}')
+                lines.append(f'jobbank_stage_seconds_sum{{stage="{stage}"}} '
+                             f'{histogram.sum}')
+                lines.append(f'jobbank_stage_seconds_count{{stage="{stage}"}} '
+                             f'{histogram.count}')
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f'# TYPE jobbank_{name} gauge')
+                lines.append(f'jobbank_{name} {value}')
+
+        lines.append('# TYPE jobbank_scrapy_stat gauge')
+        for name, value in sorted(dict(self.stats.get_stats()).items()):
+            if isinstance(value, (int, float)):
+                lines.append(f'jobbank_scrapy_stat{{name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _handler(metrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return MetricsHandler
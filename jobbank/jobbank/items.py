@@ -1,16 +1,91 @@
 import scrapy
+from dataclasses import dataclass
+from typing import ClassVar
 from urllib.parse import urlparse, urlunparse
 
 
+# Fields that are identical for every Job Bank posting
+JOBBANK_SOURCE = {
+    'logo': 'https://upload.wikimedia.org/wikipedia/commons/thumb/d/d9/Flag_of_Canada_%28Pantone%29.svg/1200px-Flag_of_Canada_%28Pantone%29.svg.png',
+    'source': 'Job bank',
+    'country': 'Canada',
+}
+
+
 class JobbankItem(scrapy.Item):
     title = scrapy.Field() 
     date = scrapy.Field()  
+    posted_at = scrapy.Field()  # date as a datetime, for range queries
     business = scrapy.Field()  
     location = scrapy.Field()  
     salary = scrapy.Field()  
+    # Parsed from salary and location at ingest
+    salary_min = scrapy.Field()
+    salary_max = scrapy.Field()
+    salary_period = scrapy.Field()  # hourly, daily, weekly, ..., annual
+    salary_annual_min = scrapy.Field()
+    salary_annual_max = scrapy.Field()
+    city = scrapy.Field()
+    province = scrapy.Field()  # Two-letter code, e.g. ON
+    cluster_id = scrapy.Field()  # Shared by near-duplicate postings
     job_link = scrapy.Field(serializer=lambda value: urlunparse(urlparse(
         # The link to the job listing
         value)) if isinstance(value, str) else value)
     logo = scrapy.Field()  
     source = scrapy.Field()  
     country = scrapy.Field()  
+
+
+class JobDetailItem(scrapy.Item):
+    """Fields of a posting's detail page, merged into its stored document."""
+    job_link = scrapy.Field()
+    description = scrapy.Field()
+    noc_code = scrapy.Field()
+    hours = scrapy.Field()
+    vacancies = scrapy.Field()
+    employment_terms = scrapy.Field()
+    # Hash of the listing the details were fetched for, so unchanged
+    # postings are not fetched again
+    listing_hash = scrapy.Field()
+
+
+class SeenPostingsItem(scrapy.Item):
+    """
+    Job links of the postings on a result page that were stored before, so
+    their ``last_seen`` is updated without storing them again.
+    """
+    job_links = scrapy.Field()
+
+
+@dataclass(slots=True)
+class JobRecord:
+    """
+    Compact form of a posting on its way from the spider to the writer.
+
+    Only the fields scraped from the listing are stored per posting; the
+    per-source constants are shared by the class and attached when the
+    record is converted with ``to_item`` or ``to_document``.
+    """
+    title: str
+    date: str
+    business: str
+    location: str
+    salary: str
+    job_link: str
+
+    constants: ClassVar[dict] = JOBBANK_SOURCE
+
+    def to_document(self):
+        document = {field: getattr(self, field) for field in self.__slots__}
+        document.update(self.constants)
+        return document
+
+    def to_item(self):
+        return JobbankItem(**self.to_document())
+
+
+def as_item(item):
+    """Returns ``item`` as a JobbankItem, expanding compact records."""
+    if isinstance(item, JobRecord):
+        return item.to_item()
+    return item
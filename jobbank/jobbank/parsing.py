@@ -0,0 +1,122 @@
+import threading
+
+from lxml import etree
+
+from jobbank.items import JobRecord
+from jobbank.transformations import clean_text, transform_job_link, transform_title
+
+ARTICLES_XPATH = etree.XPath(
+    "//article[contains(concat(' ', normalize-space(@class), ' '),"
+    " ' action-buttons ')]")
+
+# li classes of the listing fields, inside ul.list-unstyled
+LIST_FIELDS = ('date', 'business', 'location', 'salary')
+
+# lxml parsers must not be shared between threads
+_parsers = threading.local()
+
+
+def _parser():
+    parser = getattr(_parsers, 'parser', None)
+    if parser is None:
+        parser = _parsers.parser = etree.HTMLParser(recover=True,
+                                                    encoding='utf-8')
+    return parser
+
+
+def _root(html):
+    # Same preprocessing as parsel, so the tree matches the one Scrapy's
+    # selectors would build
+    body = html.strip().replace('\x00', '').encode('utf-8') or b'<html/>'
+    root = etree.fromstring(body, parser=_parser())
+    if root is None:
+        root = etree.fromstring(b'<html/>', parser=_parser())
+    return root
+
+
+def _inside(element, tag, name, article):
+    """True if ``element`` has a ``<tag class="name">`` ancestor in ``article``."""
+    parent = element.getparent()
+    while parent is not None and parent is not article:
+        if parent.tag == tag and name in (parent.get('class') or '').split():
+            return True
+        parent = parent.getparent()
+    return False
+
+
+def _texts(elements):
+    """The text nodes directly inside ``elements``, like ``::text``."""
+    for element in elements:
+        if element.text is not None:
+            yield element.text
+        for child in element:
+            if child.tail is not None:
+                yield child.tail
+
+
+def _first(values):
+    return next(iter(values), None)
+
+
+def _article_fields(article):
+    """
+    Collects the elements of every listing field in one walk over the
+    article, matching the selectors JobbankSpider used to run one by one.
+    """
+    titles = []
+    links = []
+    fields = {name: [] for name in LIST_FIELDS}
+    for element in article.iter('span', 'li', 'a'):
+        classes = element.get('class')
+        if not classes:
+            continue
+        classes = classes.split()
+        if element.tag == 'span':
+            if 'noctitle' in classes and _inside(element, 'h3', 'title',
+                                                 article):
+                titles.append(element)
+        elif element.tag == 'li':
+            names = [name for name in LIST_FIELDS if name in classes]
+            if names and _inside(element, 'ul', 'list-unstyled', article):
+                for name in names:
+                    fields[name].append(element)
+        elif 'resultJobItem' in classes:
+            links.append(element)
+    return titles, fields, links
+
+
+def parse_listings(html, base_url, unwanted_text):
+    """
+    Parses the result articles of a search page. Returns the JobRecords and
+    the errors of the articles that could not be parsed.
+
+    Runs in the shard worker threads or in a process pool, so it only
+    depends on its arguments.
+    """
+    records = []
+    errors = []
+    for article in ARTICLES_XPATH(_root(html)):
+        try:
+            titles, fields, links = _article_fields(article)
+            title = _first(_texts(titles))
+            date = _first(_texts(fields['date'])).strip()
+            business = _first(_texts(fields['business']))
+            location = list(_texts(fields['location']))
+            salary = _first(_texts(fields['salary']))
+            job_link = _first(link.get('href') for link in links
+                              if link.get('href') is not None)
+
+            location_text = ' '.join(location).strip(
+            ) if location else 'Not specified'
+
+            records.append(JobRecord(
+                title=transform_title(clean_text(title), unwanted_text),
+                date=date,
+                business=clean_text(business),
+                location=location_text,
+                salary=clean_text(salary),
+                job_link=transform_job_link(job_link, base_url),
+            ))
+        except Exception as e:
+            errors.append(str(e))
+    return records, errors
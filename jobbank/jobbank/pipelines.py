@@ -1,44 +1,215 @@
 from pymongo import MongoClient
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.defer import deferred_from_coro
 from scrapy.utils.project import get_project_settings
-from jobbank.transformations import clean_text, transform_title, transform_date, transform_job_link, add_source
+from twisted.internet import task
+from jobbank.checkpoint import Spool
+from jobbank.dedupe import index_from_settings
+from jobbank.handoff import SpillQueue
+from jobbank.instrumentation import timed
+from jobbank.items import JobDetailItem, JobRecord, SeenPostingsItem, as_item
+from jobbank.schema import SchemaError, ensure_schema, ensure_schema_async
+from jobbank.transformations import clean_text, transform_title, transform_job_link, add_source, normalize_date, add_salary_fields, add_location_fields
+from jobbank.writer import AsyncBulkWriter, BulkWriter
 import threading
+import time
 import queue
-from datetime import datetime  
 from urllib.parse import urlparse  
 import sys
 
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:  # pymongo < 4.9
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except ImportError:
+        AsyncMongoClient = None
+
+# Fields needed to warm the content hash cache
+HASH_PROJECTION = {'_id': 0, 'job_link': 1, 'content_hash': 1,
+                   'listing_hash': 1}
+
 
 class JobbankPipeline:
+    dedupe = None
+    closing = False
+
     def open_spider(self, spider):
         settings = get_project_settings()
         self.mongo_uri = settings.get('MONGO_URI')
         self.mongo_db = settings.get('MONGO_DATABASE')
         self.mongo_collection = settings.get('MONGO_COLLECTION')
-        self.client = MongoClient(self.mongo_uri)
-        self.db = self.client[self.mongo_db]
-        self.collection = self.db[self.mongo_collection]
+        self._connect()
 
-        # Initialize the item queue
-        self.item_queue = queue.Queue()
+        # Upserts look postings up by job_link, so the indexes have to be
+        # in place before the first write
+        try:
+            ensure_schema(self.collection,
+                          settings.getfloat('MONGO_EXPIRE_AFTER_DAYS', 0),
+                          logger=spider.logger)
+        except SchemaError:
+            # Writing on would store more duplicates
+            raise
+        except Exception as e:
+            spider.logger.error(f"Could not create the indexes: {e}")
+
+        # Items wait for the workers in a queue that spills to disk past
+        # MONGO_QUEUE_MEMORY_ITEMS and pauses paging above its high watermark
+        self.item_queue = SpillQueue(
+            memory_items=settings.getint('MONGO_QUEUE_MEMORY_ITEMS', 10000),
+            high_watermark=settings.getint('MONGO_QUEUE_HIGH_WATERMARK', 5000),
+            low_watermark=settings.getint('MONGO_QUEUE_LOW_WATERMARK', 1000),
+            spill_dir=settings.get('MONGO_QUEUE_SPILL_DIR'),
+        )
         spider.item_queue = self.item_queue  # Set the item queue for the spider
 
-        # Start the worker threads (adjust the number as needed)
+        # Items are upserted in unordered bulk batches
         self.spider = spider  # Store the spider instance
-        for _ in range(6):  # Example: 6 worker threads
+        crawler = getattr(spider, 'crawler', None)
+        self.writer = BulkWriter(
+            self.collection,
+            batch_size=settings.getint('MONGO_BATCH_SIZE', 500),
+            flush_interval=settings.getfloat('MONGO_FLUSH_INTERVAL', 2.0),
+            stats=crawler.stats if crawler else None,
+            logger=spider.logger,
+            on_written=self._mark_seen,
+            touch_unchanged=settings.getbool('MONGO_TOUCH_UNCHANGED', True),
+            observe=self._observe,
+            retries=settings.getint('MONGO_WRITE_RETRIES', 5),
+            retry_delay=settings.getfloat('MONGO_RETRY_DELAY', 0.5),
+            retry_max_delay=settings.getfloat('MONGO_RETRY_MAX_DELAY', 30.0),
+            before_write=self._save_clusters,
+        )
+        # Load the stored content hashes in one pass instead of one query
+        # per item
+        self.writer.warm(self.collection.find({}, HASH_PROJECTION))
+        # Lets the spider skip detail pages it already enriched
+        spider.enriched = self.writer.enriched
+        self.dedupe = self._open_dedupe(settings)
+
+        # Start the worker threads
+        self.workers = []
+        for _ in range(settings.getint('MONGO_WRITER_THREADS', 6)):
             worker_thread = threading.Thread(target=self.process_items)
             # Allow the main thread to exit even if workers are running
             worker_thread.daemon = True
             worker_thread.start()
+            self.workers.append(worker_thread)
+
+        # Items left over by a crash are written first
+        for item in self._open_spool(settings):
+            self.process_item(item, spider)
+
+    def _open_dedupe(self, settings):
+        # Reposts of a posting under a new job link share its cluster_id
+        if getattr(self.spider, 'run_id', None):
+            # The index is local to a node, so nodes would disagree
+            self.spider.logger.info(
+                'Not assigning near-duplicate clusters in a distributed '
+                'run; run jobbank/dedupe.py once it is over')
+            return None
+        try:
+            return index_from_settings(settings)
+        except Exception as e:
+            self.spider.logger.error(
+                f"Could not open the duplicate index: {e}")
+            return None
+
+    def _save_clusters(self):
+        # Before the batch storing the cluster ids is written, so the index
+        # never misses a stored one
+        if self.dedupe is not None:
+            self.dedupe.save()
+
+    def _close_dedupe(self):
+        if self.dedupe is not None:
+            self.dedupe.close()
+
+    def _open_spool(self, settings):
+        """
+        Opens the spool of unwritten items and returns the items the
+        previous run left in it.
+        """
+        spool_path = settings.get('JOBBANK_SPOOL_PATH')
+        self.spool = Spool(spool_path) if spool_path else None
+        if self.spool is None:
+            return []
+
+        replayed = self.spool.replay()
+        if replayed:
+            self.spider.logger.info(
+                f'Replaying {len(replayed)} items spooled by the previous run')
+        self.compactor = task.LoopingCall(self._compact_spool)
+        self.compactor.start(self.writer.flush_interval, now=False)
+        return replayed
+
+    def _compact_spool(self):
+        # Runs on the reactor thread like process_item, so nothing is
+        # spooled while checking. Once the queue is drained and the writer
+        # is idle, only the items it still has to store are needed.
+        if self.item_queue.unfinished_tasks:
+            return
+        unsaved = self.writer.unsaved_links()
+        if unsaved is not None:
+            self.spool.keep(unsaved)
+
+    def _close_spool(self):
+        if self.spool is None:
+            return
+        if self.compactor.running:
+            self.compactor.stop()
+        self._compact_spool()
+        if self.spool.count:
+            self.spider.logger.warning(
+                f'{self.spool.count} items were not stored and stay in '
+                f'{self.spool.path} for the next run')
+        self.spool.close()
+
+    def _connect(self):
+        self.client = MongoClient(self.mongo_uri)
+        self.db = self.client[self.mongo_db]
+        self.collection = self.db[self.mongo_collection]
 
     def close_spider(self, spider):
-        self.client.close()
-        # Optionally, wait for all threads to finish processing
+        # Wait for the queued items, then stop the workers and write what is
+        # still buffered before closing the connection
+        self.closing = True
         self.item_queue.join()
+        for _ in self.workers:
+            self.item_queue.put(None)
+        for worker_thread in self.workers:
+            worker_thread.join()
+        self.item_queue.close()
+        self._flush_if_due(force=True)
+        self._close_spool()
+        self._close_dedupe()
+        spider.logger.info(f'Run summary: {self.writer.summary()}')
+        self.client.close()
+
+    def _mark_seen(self, job_links):
+        seen_index = getattr(self.spider, 'seen_index', None)
+        if seen_index is not None:
+            seen_index.add_many(job_links)
+
+    def _observe(self, stage, seconds):
+        metrics = getattr(self.spider, 'metrics', None)
+        if metrics is not None:
+            metrics.observe(stage, seconds)
+
+    def process_item(self, item, spider):
+        # Validation and writes happen on the worker threads. Compact
+        # records stay compact while they wait in the queue. A lost
+        # last_seen update is not worth spooling.
+        if self.spool is not None and not isinstance(item, SeenPostingsItem):
+            self.spool.append(item)
+        self.item_queue.put((time.monotonic(), item))
+        return item
 
     def _validate_item(self, item):
         """
         Validates the JobbankItem to ensure it has essential data and conforms to
-        expected formats.
+        expected formats. The date is converted to 'YYYY-MM-DD' and
+        ``posted_at`` while being validated.
         """
 
         errors = []  # Collect validation errors
@@ -51,9 +222,12 @@ class JobbankPipeline:
         # 2. Data Type and Format Validation
         if item.get('date') and not isinstance(item['date'], str):
             errors.append("Invalid data type for 'date'. Should be a string.")
-        if item.get('date') and not validate_date_format(item['date']):
-            errors.append(f"Invalid date format: {
-                          item['date']}. Expected format: Month Day, Year")
+        elif item.get('date'):
+            try:
+                item['date'], item['posted_at'] = normalize_date(item['date'])
+            except ValueError:
+                errors.append(f"Invalid date format: {item['date']}. "
+                              "Expected format: Month Day, Year")
 
         # 3. URL Validation (Optional)
         if item.get('job_link') and not validate_url(item['job_link']):
@@ -70,54 +244,227 @@ class JobbankPipeline:
             item['title'] = transform_title(clean_text(
                 item.get('title', '')), self.spider.unwanted_text)
 
-            # Clean and process the date
-            date_str = clean_text(item.get('date', ''))
-            self.spider.logger.debug(
-                f"Cleaned date: '{date_str}'")  # Log cleaned date
-
-            # Use the updated transform_date function
-            item['date'] = transform_date(date_str)
+            # The date was already normalized by _validate_item
 
             item['job_link'] = transform_job_link(
                 item.get('job_link', ''), self.spider.base_url)
-            item = add_source(item, self.spider.start_urls[0])
+            item = add_source(item)
+
+            # Structured salary and location, so queries filter on indexed
+            # fields instead of scanning the free text
+            add_salary_fields(item)
+            add_location_fields(item)
+
+            if self.dedupe is not None:
+                with timed(self.spider, 'dedupe'):
+                    item['cluster_id'] = self.dedupe.assign(item)
 
         except Exception as e:
             self.spider.logger.error(f"Error processing item: {e}")
 
     def _insert_item(self, item):
-        self.collection.update_one(
-            {'job_link': item['job_link']}, {'$set': dict(item)}, upsert=True
-        )
+        self.writer.add(item)
         return item
 
     def process_items(self):
         while True:
+            if self.writer.backlogged() and not self.closing:
+                # MongoDB is failing: the items stay in the queue, which
+                # spills to disk and pauses paging, while the failed writes
+                # are sent again
+                self._retry_unsaved()
+                continue
             try:
-                item = self.item_queue.get()
-                item = self._validate_item(item)  # Validate the item
-                self._process_data(item)
-                self._insert_item(item)
-                self.spider.logger.info(f"Processed and saved: {item}")
+                entry = self.item_queue.get(timeout=self.writer.flush_interval)
             except queue.Empty:
-                pass
+                self._flush_if_due()
+                continue
+
+            if entry is None:  # Sentinel sent by close_spider
+                self.item_queue.task_done()
+                break
+
+            try:
+                enqueued_at, item = entry
+                self._observe_lag(time.monotonic() - enqueued_at)
+                if self.closing and self.writer.backlogged():
+                    # Still failing at shutdown: the spool keeps the item
+                    # for the next run
+                    self._hold(item)
+                elif isinstance(item, JobDetailItem):
+                    self.writer.add_detail(item)
+                elif isinstance(item, SeenPostingsItem):
+                    self.writer.touch(item['job_links'])
+                else:
+                    with timed(self.spider, 'validate'):
+                        item = self._validate_item(as_item(item))  # Validate the item
+                        self._process_data(item)
+                    self._insert_item(item)
+                self.spider.logger.debug(f"Processed and queued: {item}")
             except Exception as e:
                 self.spider.logger.error(f"Error in process_items: {e}")
             finally:  # Always call task_done() in a finally block
                 self.item_queue.task_done()
+            self._flush_if_due()
+
+    def _retry_unsaved(self):
+        try:
+            self.writer.flush()
+        except Exception as e:
+            self.spider.logger.error(f"Error flushing items: {e}")
+            time.sleep(self.writer.flush_interval)
+
+    def _hold(self, item):
+        if isinstance(item, JobRecord):
+            self.writer.hold(item.job_link)
+        elif not isinstance(item, SeenPostingsItem):
+            self.writer.hold(item.get('job_link'))
+
+    def _observe_lag(self, seconds):
+        # Time the item waited for a worker, i.e. how far the writer lags
+        metrics = getattr(self.spider, 'metrics', None)
+        if metrics is not None:
+            metrics.observe('queue_wait', seconds)
+            metrics.gauge('writer_lag_seconds', round(seconds, 3))
+
+    def _flush_if_due(self, force=False):
+        try:
+            if force:
+                self.writer.drain()
+            else:
+                self.writer.flush_if_due()
+        except Exception as e:
+            self.spider.logger.error(f"Error flushing items: {e}")
 
     def signal_handler(self, sig, frame):
         # Close the MongoDB connection and exit
         self.client.close()
         sys.exit(0)
 
+
+class AsyncJobbankPipeline(JobbankPipeline):
+    """
+    Validates and upserts items from process_item on Scrapy's reactor with an
+    asyncio MongoDB client instead of worker threads.
+
+    Requires TWISTED_REACTOR to be the asyncio reactor and either pymongo >= 4.9
+    or motor. Items wait in process_item while MONGO_MAX_INFLIGHT batches are
+    being written, which in turn slows down the spider.
+    """
+
+    def open_spider(self, spider):
+        if AsyncMongoClient is None:
+            raise NotConfigured(
+                'AsyncJobbankPipeline requires pymongo >= 4.9 or motor')
+
+        settings = get_project_settings()
+        self.mongo_uri = settings.get('MONGO_URI')
+        self.mongo_db = settings.get('MONGO_DATABASE')
+        self.mongo_collection = settings.get('MONGO_COLLECTION')
+        self._connect()
+
+        self.spider = spider
+        crawler = getattr(spider, 'crawler', None)
+        self.writer = AsyncBulkWriter(
+            self.collection,
+            batch_size=settings.getint('MONGO_BATCH_SIZE', 500),
+            flush_interval=settings.getfloat('MONGO_FLUSH_INTERVAL', 2.0),
+            stats=crawler.stats if crawler else None,
+            logger=spider.logger,
+            on_written=self._mark_seen,
+            touch_unchanged=settings.getbool('MONGO_TOUCH_UNCHANGED', True),
+            observe=self._observe,
+            retries=settings.getint('MONGO_WRITE_RETRIES', 5),
+            retry_delay=settings.getfloat('MONGO_RETRY_DELAY', 0.5),
+            retry_max_delay=settings.getfloat('MONGO_RETRY_MAX_DELAY', 30.0),
+            max_inflight=settings.getint('MONGO_MAX_INFLIGHT', 4),
+            before_write=self._save_clusters,
+        )
+
+        spider.enriched = self.writer.enriched
+        # The writer holds the items not written yet, so the queue depth
+        # gauge reads it instead of a queue
+        spider.item_queue = self.writer
+        self.dedupe = self._open_dedupe(settings)
+
+        # Flush partially filled batches when items arrive slowly
+        self.flusher = task.LoopingCall(self._flush_if_due)
+        self.flusher.start(self.writer.flush_interval, now=False)
+
+        return deferred_from_coro(self._open(settings))
+
+    async def _open(self, settings):
+        try:
+            await ensure_schema_async(
+                self.collection,
+                settings.getfloat('MONGO_EXPIRE_AFTER_DAYS', 0),
+                logger=self.spider.logger)
+        except SchemaError:
+            raise
+        except Exception as e:
+            self.spider.logger.error(f"Could not create the indexes: {e}")
+        await self.writer.warm(self.collection.find({}, HASH_PROJECTION))
+        # Items left over by a crash are written first
+        for item in self._open_spool(settings):
+            await self.process_item(item, self.spider)
+
+    def _compact_spool(self):
+        unsaved = self.writer.unsaved_links()
+        if unsaved is not None:
+            self.spool.keep(unsaved)
+
+    def _connect(self):
+        self.client = AsyncMongoClient(self.mongo_uri)
+        self.db = self.client[self.mongo_db]
+        self.collection = self.db[self.mongo_collection]
+
+    def close_spider(self, spider):
+        if self.flusher.running:
+            self.flusher.stop()
+        return deferred_from_coro(self._close())
+
+    async def _close(self):
+        await self.writer.drain()
+        self._close_spool()
+        self._close_dedupe()
+        self.spider.logger.info(f'Run summary: {self.writer.summary()}')
+        close = self.client.close()
+        if close is not None:  # AsyncMongoClient.close is a coroutine
+            await close
+
+    async def process_item(self, item, spider):
+        if isinstance(item, SeenPostingsItem):
+            await self.writer.touch(item['job_links'])
+            return item
+        if self.spool is not None:
+            self.spool.append(item)
+        if isinstance(item, JobDetailItem):
+            await self.writer.add_detail(item)
+            return item
+        try:
+            with timed(spider, 'validate'):
+                document = self._validate_item(as_item(item))
+                self._process_data(document)
+        except ValueError as e:
+            raise DropItem(str(e))
+        await self.writer.add(document)
+        # The object we got, which the spider's page acks are keyed on
+        return item
+
+    def _flush_if_due(self):
+        d = deferred_from_coro(self.writer.flush_if_due())
+        d.addErrback(lambda failure: self.spider.logger.error(
+            f"Error flushing items: {failure.value}"))
+        return d
+
+
 # Helper Functions for Validation
 
 
 def validate_date_format(date_str):
     """Checks if the date string matches the expected format Month Day, Year."""
     try:
-        datetime.strptime(date_str, '%B %d, %Y')
+        normalize_date(date_str)
         return True
     except ValueError:
         return False
@@ -0,0 +1,88 @@
+"""
+Common lookups on the postings collection. Each one is served by an index
+created by jobbank.schema.
+"""
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING
+
+from jobbank.transformations import normalize_job_link
+
+# Internal bookkeeping fields left out of query results
+DEFAULT_PROJECTION = {'_id': 0, 'content_hash': 0, 'listing_hash': 0}
+
+
+def _days_ago(days):
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+
+def posting(collection, job_link):
+    """Returns the posting stored for ``job_link``, or None."""
+    return collection.find_one({'job_link': normalize_job_link(job_link)},
+                               DEFAULT_PROJECTION)
+
+
+def recent_postings(collection, days=7, limit=100):
+    """Postings published in the last ``days`` days, newest first."""
+    return collection.find(
+        {'posted_at': {'$gte': _days_ago(days)}}, DEFAULT_PROJECTION,
+    ).sort('posted_at', DESCENDING).limit(limit)
+
+
+def postings_in_province(collection, province, days=None, limit=100):
+    """
+    Postings of ``province`` (a two-letter code such as 'ON'), newest
+    first, optionally limited to the last ``days`` days.
+    """
+    query = {'province': province.upper()}
+    if days is not None:
+        query['posted_at'] = {'$gte': _days_ago(days)}
+    return collection.find(query, DEFAULT_PROJECTION).sort(
+        'posted_at', DESCENDING).limit(limit)
+
+
+def postings_by_salary(collection, minimum=None, maximum=None, limit=100):
+    """
+    Postings whose annualized salary range overlaps ``minimum`` to
+    ``maximum`` (either may be None), best paid first.
+    """
+    query = {'salary_annual_max': {'$ne': None}}
+    if minimum is not None:
+        query['salary_annual_max'] = {'$gte': minimum}
+    if maximum is not None:
+        query['salary_annual_min'] = {'$lte': maximum}
+    return collection.find(query, DEFAULT_PROJECTION).sort(
+        'salary_annual_max', DESCENDING).limit(limit)
+
+
+def duplicates(collection, job_link):
+    """
+    The other postings in the near-duplicate cluster of ``job_link``,
+    oldest first.
+    """
+    job_link = normalize_job_link(job_link)
+    stored = collection.find_one({'job_link': job_link}, {'cluster_id': 1})
+    if not stored or not stored.get('cluster_id'):
+        return []
+    return collection.find(
+        {'cluster_id': stored['cluster_id'], 'job_link': {'$ne': job_link}},
+        DEFAULT_PROJECTION,
+    ).sort('first_seen', ASCENDING)
+
+
+def changed_since(collection, since):
+    """Postings created or changed after ``since``, oldest change first."""
+    return collection.find(
+        {'updated_at': {'$gt': since}}, DEFAULT_PROJECTION,
+    ).sort('updated_at', ASCENDING)
+
+
+def delisted_postings(collection, days=7):
+    """
+    Postings no crawl has seen in the last ``days`` days. Crawls stopping at
+    known postings (JOBBANK_EARLY_STOP_AFTER) do not reach the older ones,
+    so this needs a full crawl within ``days``.
+    """
+    return collection.find(
+        {'last_seen': {'$lt': _days_ago(days)}}, DEFAULT_PROJECTION,
+    ).sort('last_seen', ASCENDING)
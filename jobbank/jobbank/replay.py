@@ -0,0 +1,116 @@
+# replay.py
+"""
+Parses the result pages captured with JOBBANK_CAPTURE_DIR again and stores
+the postings through JobbankPipeline, without a browser or network. Use it
+to apply parser or transformation changes to the collection:
+
+    python jobbank/replay.py captures [--since 2024-06-01] [--dry-run]
+
+Every replayed posting is rewritten with the current transformations, even
+if its listing did not change. ``last_seen`` of stored postings is left
+alone, as replaying a page does not mean the posting is still listed;
+postings stored for the first time get the replay time. Pages are parsed in
+JOBBANK_PARSE_PROCESSES processes when set.
+"""
+import argparse
+import collections
+import logging
+import time
+
+from jobbank.capture import PageArchive
+from jobbank.items import JobRecord
+from jobbank.pipelines import JobbankPipeline
+from jobbank.spiders.jobbank_spider import JobbankSpider
+
+logger = logging.getLogger(__name__)
+
+# Pages read ahead of the parser, per parse process
+READ_AHEAD = 4
+
+
+class ReplayPipeline(JobbankPipeline):
+    """JobbankPipeline rewriting every posting, without the crawl's spool."""
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        self.writer.rewrite = True
+        self.writer.mark_seen = False
+
+    def _open_spool(self, settings):
+        # The archive already holds everything needed to replay again
+        self.spool = None
+        return []
+
+
+def parsed_pages(archive, entries, spider):
+    """
+    Yields ``(records, errors)`` for the pages of ``entries`` in order,
+    keeping the parse pool busy if the spider has one.
+    """
+    window = READ_AHEAD * max(1, spider.project_settings.getint(
+        'JOBBANK_PARSE_PROCESSES', 0))
+    pending = collections.deque()
+    for entry in entries:
+        pending.append(spider._submit_parse(archive.read(entry['digest'])))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def replay(archive, spider, pipeline=None, since=None):
+    """
+    Parses the pages of ``archive`` captured since ``since`` and hands the
+    postings to ``pipeline`` (None only counts them). Returns the number
+    of pages and postings replayed.
+    """
+    pages = postings = 0
+    for records, errors in parsed_pages(archive, archive.entries(since),
+                                        spider):
+        pages += 1
+        for record in spider._new_records(records, errors):
+            if isinstance(record, JobRecord):
+                postings += 1
+            if pipeline is None:
+                continue
+            # Wait for the writer rather than spilling the queue to disk
+            while not pipeline.item_queue.wait_for_room(1):
+                pass
+            pipeline.process_item(record, spider)
+    return pages, postings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Replay captured result pages into the collection.')
+    parser.add_argument('archive', help='Capture directory (JOBBANK_CAPTURE_DIR)')
+    parser.add_argument('--since',
+                        help='Only replay pages captured at or after this '
+                             'ISO 8601 date or time')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Parse the pages without storing the postings')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    spider = JobbankSpider()
+    # Replayed postings are stored even if a crawl already did
+    spider.seen_index = None
+
+    pipeline = None if args.dry_run else ReplayPipeline()
+    start = time.monotonic()
+    if pipeline is not None:
+        pipeline.open_spider(spider)
+    try:
+        pages, postings = replay(PageArchive(args.archive), spider, pipeline,
+                                 args.since)
+    finally:
+        if pipeline is not None:
+            pipeline.close_spider(spider)
+        if spider.parse_pool is not None:
+            spider.parse_pool.shutdown()
+    logger.info(f'Replayed {postings} postings from {pages} pages in '
+                f'{time.monotonic() - start:.1f} s')
@@ -0,0 +1,247 @@
+# schema.py
+"""
+Indexes of the postings collection. Run as a script to create them. With
+--backfill it first moves postings stored under a raw job link to the
+normalized one, merging duplicates so the unique index can be built, and
+fills in the structured salary and location fields and ``posted_at`` of
+postings stored before those fields existed:
+
+    python jobbank/schema.py --backfill
+"""
+import argparse
+import logging
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+from scrapy.utils.project import get_project_settings
+
+from jobbank.transformations import (add_location_fields, add_salary_fields,
+                                     normalize_date, normalize_job_link)
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 24 * 60 * 60
+DUPLICATE_KEY = 11000
+DUPLICATES_MESSAGE = (
+    'Postings are stored twice under the same job link, so the unique '
+    'job_link index cannot be built. Run python jobbank/schema.py --backfill '
+    'to merge them')
+
+
+class SchemaError(Exception):
+    """The stored postings need a migration before the indexes can be built."""
+
+
+def index_models(expire_after_days=0):
+    """
+    Returns the indexes of the postings collection.
+
+    - job_link: unique, so upserts on it are index lookups and concurrent
+      nodes cannot store a posting twice
+    - posted_at: recent postings; with ``expire_after_days`` it is also a TTL
+      index that deletes postings that many days after their posting date
+    - last_seen: postings no longer listed
+    - updated_at: incremental exports
+    - province, posted_at: recent postings of a province
+    - salary_annual_max, salary_annual_min: salary ranges, best paid first
+    - cluster_id: near-duplicates of a posting
+    """
+    posted_at_options = {}
+    if expire_after_days:
+        posted_at_options['expireAfterSeconds'] = int(
+            expire_after_days * SECONDS_PER_DAY)
+    return [
+        IndexModel([('job_link', ASCENDING)], unique=True),
+        IndexModel([('posted_at', DESCENDING)], **posted_at_options),
+        IndexModel([('last_seen', ASCENDING)]),
+        IndexModel([('updated_at', ASCENDING)]),
+        IndexModel([('province', ASCENDING), ('posted_at', DESCENDING)]),
+        IndexModel([('salary_annual_max', DESCENDING),
+                    ('salary_annual_min', ASCENDING)]),
+        IndexModel([('cluster_id', ASCENDING)]),
+    ]
+
+
+def _stale_indexes(existing, models):
+    """
+    Names of the existing indexes whose options differ from ``models``, e.g.
+    after MONGO_EXPIRE_AFTER_DAYS changed. They are dropped and rebuilt.
+    """
+    stale = []
+    for model in models:
+        document = model.document
+        current = existing.get(document['name'])
+        if current is None:
+            continue
+        for option in ('expireAfterSeconds', 'unique'):
+            if current.get(option) != document.get(option):
+                stale.append(document['name'])
+                break
+    return stale
+
+
+def ensure_schema(collection, expire_after_days=0, logger=logger):
+    """
+    Creates the indexes of the postings collection if needed. Raises
+    SchemaError if duplicate postings prevent the unique job_link index.
+    """
+    unique, *models = index_models(expire_after_days)
+    for name in _stale_indexes(collection.index_information(),
+                               [unique] + models):
+        logger.info(f'Rebuilding index {name} with new options')
+        collection.drop_index(name)
+    collection.create_indexes(models)
+    # On its own, so the other indexes exist even if it fails
+    try:
+        collection.create_indexes([unique])
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY:
+            raise
+        raise SchemaError(DUPLICATES_MESSAGE) from e
+
+
+async def ensure_schema_async(collection, expire_after_days=0,
+                              logger=logger):
+    """ensure_schema for async MongoDB clients."""
+    unique, *models = index_models(expire_after_days)
+    existing = await collection.index_information()
+    for name in _stale_indexes(existing, [unique] + models):
+        logger.info(f'Rebuilding index {name} with new options')
+        await collection.drop_index(name)
+    await collection.create_indexes(models)
+    try:
+        await collection.create_indexes([unique])
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY:
+            raise
+        raise SchemaError(DUPLICATES_MESSAGE) from e
+
+
+def normalize_job_links(collection, batch_size=1000):
+    """
+    Moves the postings stored under a job link that is not normalized (with
+    a session id, query string or trailing slash) to the normalized link.
+    A posting already stored under that link keeps its fields, gets the
+    earlier ``first_seen`` and later ``last_seen`` of the two, and the other
+    one is deleted. Returns the number of postings moved or merged.
+    """
+    changed = 0
+    cursor = collection.find({}, {'job_link': 1, 'first_seen': 1,
+                                  'last_seen': 1}, batch_size=batch_size)
+    for document in cursor:
+        link = normalize_job_link(document['job_link'])
+        if link == document['job_link']:
+            continue
+        stored = collection.find_one({'job_link': link}, {'_id': 1})
+        if stored is None:
+            collection.update_one({'_id': document['_id']}, {
+                '$set': {'job_link': link},
+                '$currentDate': {'updated_at': True},
+            })
+        else:
+            update = {'$currentDate': {'updated_at': True}}
+            if document.get('first_seen'):
+                update['$min'] = {'first_seen': document['first_seen']}
+            if document.get('last_seen'):
+                update['$max'] = {'last_seen': document['last_seen']}
+            collection.update_one({'_id': stored['_id']}, update)
+            collection.delete_one({'_id': document['_id']})
+        changed += 1
+    return changed
+
+
+def update_each(collection, cursor, fields_for, batch_size=1000,
+                before_write=None):
+    """
+    Sets the fields ``fields_for`` returns for every document of ``cursor``
+    and their ``updated_at``, in unordered bulk writes of ``batch_size``
+    updates. ``before_write`` is called before every write. Returns the
+    number of documents modified.
+    """
+    updated = 0
+    batch = []
+    for document in cursor:
+        batch.append(UpdateOne({'_id': document['_id']},
+                               {'$set': fields_for(document),
+                                '$currentDate': {'updated_at': True}}))
+        if len(batch) >= batch_size:
+            updated += _write_batch(collection, batch, before_write)
+            batch = []
+    if batch:
+        updated += _write_batch(collection, batch, before_write)
+    return updated
+
+
+def _write_batch(collection, batch, before_write):
+    if before_write is not None:
+        before_write()
+    return collection.bulk_write(batch, ordered=False).modified_count
+
+
+def _structured_fields(document):
+    fields = add_location_fields(add_salary_fields({
+        'salary': document.get('salary'),
+        'location': document.get('location'),
+    }))
+    del fields['salary'], fields['location']
+    posted_at = _posted_at(document.get('date'))
+    if posted_at is not None:
+        fields['posted_at'] = posted_at
+    return fields
+
+
+def _posted_at(date):
+    # Postings stored before posted_at hold the date as 'YYYY-MM-DD'
+    try:
+        return datetime.strptime(date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        pass
+    try:
+        return normalize_date(date)[1]
+    except ValueError:
+        return None
+
+
+def backfill_structured_fields(collection, batch_size=1000):
+    """
+    Adds the salary and location fields and ``posted_at`` to the postings
+    that lack them. Returns the number of postings updated.
+    """
+    cursor = collection.find(
+        {'$or': [{'salary_period': {'$exists': False}},
+                 {'posted_at': {'$exists': False}}]},
+        {'job_link': 1, 'salary': 1, 'location': 1, 'date': 1},
+        batch_size=batch_size)
+    return update_each(collection, cursor, _structured_fields, batch_size)
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Create the indexes of the postings collection.')
+    parser.add_argument('--backfill', action='store_true',
+                        help='Also normalize stored job links and parse the '
+                             'salary, location and posting date of postings '
+                             'stored without those fields')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    client = MongoClient(settings.get('MONGO_URI'))
+    try:
+        collection = client[settings.get('MONGO_DATABASE')][
+            settings.get('MONGO_COLLECTION')]
+        if args.backfill:
+            # Before the indexes, as duplicates block the unique one
+            moved = normalize_job_links(collection)
+            logger.info(f'Normalized the job links of {moved} postings')
+        ensure_schema(collection,
+                      settings.getfloat('MONGO_EXPIRE_AFTER_DAYS', 0))
+        logger.info('Indexes are up to date')
+        if args.backfill:
+            updated = backfill_structured_fields(collection)
+            logger.info(f'Added structured fields to {updated} postings')
+    finally:
+        client.close()
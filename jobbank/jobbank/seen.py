@@ -0,0 +1,70 @@
+import hashlib
+import heapq
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+from jobbank.checkpoint import write_atomic
+from jobbank.transformations import normalize_job_link
+
+
+class SeenIndex:
+    """
+    Compact, persistent set of the postings already stored.
+
+    Postings are keyed on a 64-bit digest of their normalized job link. The
+    ids loaded from disk are kept in a sorted array (8 bytes per posting) and
+    searched with bisect; ids added during the run live in a set until
+    ``save`` merges them into the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.ids = array('Q')
+        self.added = set()
+
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.ids.frombytes(f.read())
+
+    @staticmethod
+    def key(job_link):
+        digest = hashlib.blake2b(
+            normalize_job_link(job_link).encode('utf-8'), digest_size=8)
+        return int.from_bytes(digest.digest(), 'big')
+
+    def __len__(self):
+        return len(self.ids) + len(self.added)
+
+    def __contains__(self, job_link):
+        key = self.key(job_link)
+        if key in self.added:
+            return True
+        i = bisect_left(self.ids, key)
+        return i < len(self.ids) and self.ids[i] == key
+
+    def add_many(self, job_links):
+        keys = [self.key(link) for link in job_links]
+        with self.lock:
+            self.added.update(keys)
+
+    def save(self):
+        with self.lock:
+            if not self.added:
+                return
+            merged = array('Q', _unique(heapq.merge(self.ids,
+                                                     sorted(self.added))))
+            self.added = set()
+            self.ids = merged
+
+        write_atomic(self.path, merged.tobytes())
+
+
+def _unique(sorted_ids):
+    previous = None
+    for key in sorted_ids:
+        if key != previous:
+            yield key
+            previous = key
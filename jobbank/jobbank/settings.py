@@ -105,20 +105,48 @@ CONCURRENT_REQUESTS_PER_DOMAIN = 16
 CONCURRENT_REQUESTS_PER_IP = 16
 
 # Enable or disable downloader middlewares
-DOWNLOADER_MIDDLEWARES = {
-    'scrapy_selenium.SeleniumMiddleware': 800,
-}
+# scrapy_selenium.SeleniumMiddleware is not used: the spider drives its own
+# browser pool, and loading the middleware imports selenium.webdriver even
+# for crawls that never start a browser
+DOWNLOADER_MIDDLEWARES = {}
 
 # Enable or disable extensions
 EXTENSIONS = {
     'scrapy.extensions.telnet.TelnetConsole': None,
+    'jobbank.instrumentation.JobbankMetrics': 500,
 }
 
+# Per-stage latency histograms and queue gauges, recorded in the crawl
+# stats and served in the Prometheus format on METRICS_HOST:METRICS_PORT
+# (0 disables the endpoint). If the port is taken, e.g. by a second crawl
+# on the same host, a free port is used and logged (stat metrics/port).
+# Queue depth is sampled every METRICS_SAMPLE_INTERVAL seconds.
+METRICS_ENABLED = True
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9410
+METRICS_SAMPLE_INTERVAL = 5
+
 # Configure item pipelines
+# Use 'jobbank.pipelines.AsyncJobbankPipeline' instead to write from the
+# reactor with an asyncio MongoDB client (pymongo >= 4.9 or motor) rather
+# than with worker threads
 ITEM_PIPELINES = {
     'jobbank.pipelines.JobbankPipeline': 300,
 }
 
+# The asyncio reactor is required by AsyncJobbankPipeline
+TWISTED_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'
+
+# Detail pages are cached on disk and revalidated with If-None-Match /
+# If-Modified-Since once stale, so unchanged pages cost a 304. Search
+# pages are never cached.
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = 'scrapy.extensions.httpcache.RFC2616Policy'
+HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_ALWAYS_STORE = True  # Keep pages served without cache headers
+HTTPCACHE_IGNORE_HTTP_CODES = [500, 502, 503, 504, 408, 429]
+
 
 # ============================================================================
 # MongoDB Connection Settings
@@ -127,6 +155,41 @@ MONGO_URI = os.getenv('MONGO_URI')  # Default if missing
 MONGO_DATABASE = os.getenv('MONGO_DATABASE')        # Default if missing
 MONGO_COLLECTION = os.getenv('MONGO_COLLECTION')     # Default if missing
 
+# Items are upserted with unordered bulk writes. A batch is flushed once it
+# holds MONGO_BATCH_SIZE operations or MONGO_FLUSH_INTERVAL seconds after the
+# previous flush. MONGO_WRITER_THREADS validate items and send the batches.
+MONGO_BATCH_SIZE = 500
+MONGO_FLUSH_INTERVAL = 2.0
+MONGO_WRITER_THREADS = 6
+
+# Postings whose content hash matches the stored one only get their
+# last_seen field updated; set to False to skip the write entirely
+MONGO_TOUCH_UNCHANGED = True
+
+# Postings are deleted this many days after their posting date by a TTL
+# index on posted_at (0 keeps them forever)
+MONGO_EXPIRE_AFTER_DAYS = 0
+
+# Maximum number of batches AsyncJobbankPipeline writes at the same time
+MONGO_MAX_INFLIGHT = 4
+
+# Items waiting for the writer threads. Paging pauses once
+# MONGO_QUEUE_HIGH_WATERMARK items wait and resumes below
+# MONGO_QUEUE_LOW_WATERMARK. Past MONGO_QUEUE_MEMORY_ITEMS, items are
+# spilled to a temporary file in MONGO_QUEUE_SPILL_DIR (None for the
+# system temporary directory).
+MONGO_QUEUE_MEMORY_ITEMS = 10000
+MONGO_QUEUE_HIGH_WATERMARK = 5000
+MONGO_QUEUE_LOW_WATERMARK = 1000
+MONGO_QUEUE_SPILL_DIR = None
+
+# Batches failing because MongoDB is unreachable are retried with
+# exponential backoff, from MONGO_RETRY_DELAY up to MONGO_RETRY_MAX_DELAY
+# seconds. Batches still failing stay in the spool for the next run.
+MONGO_WRITE_RETRIES = 5
+MONGO_RETRY_DELAY = 0.5
+MONGO_RETRY_MAX_DELAY = 30.0
+
 # ============================================================================
 # Selenium Settings
 # ============================================================================
@@ -134,6 +197,13 @@ SELENIUM_DRIVER_NAME = 'chrome'
 CHROME_DRIVER_PATH = os.path.join(
     os.path.dirname(__file__), 'drivers', 'chromedriver')
 
+# Number of Chrome instances crawling search shards in parallel. A browser
+# is replaced after BROWSER_RECYCLE_AFTER_PAGES result pages or once its JS
+# heap exceeds BROWSER_RECYCLE_HEAP_MB (0 disables either check).
+BROWSER_POOL_SIZE = 1
+BROWSER_RECYCLE_AFTER_PAGES = 500
+BROWSER_RECYCLE_HEAP_MB = 1024
+
 # These arguments are recommended for a headless browser setup:
 # They should be compatible with most setups, but may need adjustment for
 # specific environments
@@ -145,6 +215,22 @@ SELENIUM_DRIVER_ARGUMENTS = [
     '--window-size=1200x800',  # Set window size (adjust as needed)
 ]
 
+# The lean profile loads pages with the 'eager' strategy (driver.get()
+# returns once the DOM is ready), disables extensions and blocks the
+# resources matching BROWSER_BLOCKED_URLS through the DevTools protocol.
+# The listings only need the HTML and the site's scripts.
+# The patterns filter URLs, not resource types: each one also blocks the
+# same URL with a query string (e.g. app.css?v=3), but a stylesheet served
+# without an extension is still loaded. Blocking by resource type needs
+# Fetch interception, whose paused requests Selenium cannot answer.
+BROWSER_LEAN_PROFILE = True
+BROWSER_PAGE_LOAD_STRATEGY = 'eager'
+BROWSER_BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico',
+    '*.css',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+]
+
 # ============================================================================
 # Spider Specific Settings
 # ============================================================================
@@ -155,6 +241,93 @@ UNWANTED_TEXT = 'Unwanted Text Here'
 # Define the base URL of the website
 BASE_URL = 'https://www.jobbank.gc.ca'
 
+# Crawl engine: 'selenium' drives Chrome, 'http' replays the "Show More
+# Results" requests directly and falls back to Selenium if the markup is
+# not what the parser expects. Can be overridden with `-a engine=http`.
+JOBBANK_ENGINE = 'selenium'
+
+# Pagination endpoint used by the HTTP engine and an optional page limit per
+# search (0 means no limit)
+JOBBANK_HTTP_LOADER_PATH = '/jobsearch/job_search_loader.xhtml'
+JOBBANK_HTTP_MAX_PAGES = 0
+
+# Fetch the detail page (description, NOC code, hours, vacancies and
+# employment terms) of every posting whose listing changed since its
+# details were last stored
+JOBBANK_ENRICH_DETAILS = True
+
+# Detail pages share the download slot, and so DOWNLOAD_DELAY, of the
+# search pages, which they yield to. To fetch them at a rate of their own,
+# name a slot and configure it with a rate the site tolerates, e.g.:
+# JOBBANK_DETAIL_DOWNLOAD_SLOT = 'jobbank-details'
+# DOWNLOAD_SLOTS = {'jobbank-details': {'concurrency': 2, 'delay': 1.5}}
+JOBBANK_DETAIL_DOWNLOAD_SLOT = ''
+
+# Split the crawl into searches paged independently by the browser pool.
+# Each entry is the query string of a search, e.g. one shard per province:
+# JOBBANK_SHARDS = ['fprov=AB', 'fprov=BC', 'fprov=MB', 'fprov=NB',
+#                   'fprov=NL', 'fprov=NS', 'fprov=NT', 'fprov=NU',
+#                   'fprov=ON', 'fprov=PE', 'fprov=QC', 'fprov=SK',
+#                   'fprov=YT']
+JOBBANK_SHARDS = []
+
+# Times a shard is retried on a fresh browser after the browser crashed
+JOBBANK_SHARD_RETRIES = 1
+
+# Distributed crawls (`-a run_id=...`): nodes share the shards of a run
+# through this collection of MONGO_DATABASE. A node renews the lease on its
+# shards while crawling; shards of a node that stopped renewing for
+# JOBBANK_SHARD_LEASE_SECONDS are crawled again by another node.
+# JOBBANK_NODE_ID defaults to hostname:pid.
+JOBBANK_SHARD_COLLECTION = 'shards'
+JOBBANK_SHARD_LEASE_SECONDS = 300
+JOBBANK_NODE_ID = None
+
+# Persistent index of the postings already stored (empty to disable). Known
+# postings are not written again, and as results are sorted newest first,
+# paging stops after JOBBANK_EARLY_STOP_AFTER consecutive known postings
+# (0 to always page through every result).
+JOBBANK_SEEN_INDEX_PATH = 'jobbank_seen.idx'
+JOBBANK_EARLY_STOP_AFTER = 100
+
+# Near-duplicate detection: postings reposted under a new job link share a
+# cluster_id. The LSH index of JOBBANK_DEDUPE_INDEX_PATH (empty to disable)
+# groups postings of the same business and location whose title and salary
+# are similar. More rows per band make matches stricter, more bands looser.
+# Single-node only: distributed runs leave cluster_id to jobbank/dedupe.py.
+JOBBANK_DEDUPE_INDEX_PATH = 'jobbank_dedupe.sqlite'
+JOBBANK_DEDUPE_BANDS = 8
+JOBBANK_DEDUPE_ROWS = 5
+
+# Only extract the articles appended by each "Show More Results" click
+# instead of re-parsing the whole result list every time
+JOBBANK_INCREMENTAL_PARSE = True
+
+# Processes parsing result pages while the browsers keep paging (0 parses
+# in the shard worker threads)
+JOBBANK_PARSE_PROCESSES = 0
+
+# Archive every parsed result page to this directory (empty to disable), so
+# parser and transformation changes can be applied with jobbank/replay.py
+# instead of a new crawl. Pages are stored once per distinct content.
+JOBBANK_CAPTURE_DIR = ''
+
+# Page waits end as soon as the results land. Their timeout is
+# JOBBANK_WAIT_TIMEOUT_MULTIPLIER times the slowest recent load, kept
+# between the min and max (seconds)
+JOBBANK_WAIT_MIN_TIMEOUT = 1.0
+JOBBANK_WAIT_MAX_TIMEOUT = 10.0
+JOBBANK_WAIT_TIMEOUT_MULTIPLIER = 3.0
+
+# Progress of every shard is saved to JOBBANK_CHECKPOINT_PATH at most every
+# JOBBANK_CHECKPOINT_INTERVAL seconds, and items are spooled to
+# JOBBANK_SPOOL_PATH until they are stored. After a crash or a shutdown
+# (SIGINT/SIGTERM), the next run writes the spooled items and resumes each
+# shard at the page it reached. Empty paths disable either.
+JOBBANK_CHECKPOINT_PATH = 'jobbank_checkpoint.json'
+JOBBANK_CHECKPOINT_INTERVAL = 10
+JOBBANK_SPOOL_PATH = 'jobbank_spool.jsonl'
+
 # Adjust this to the desired log level (INFO, DEBUG, WARNING, ERROR, CRITICAL)
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'jobbank.log'  # Specify the name of your log file
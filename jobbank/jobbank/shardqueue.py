@@ -0,0 +1,181 @@
+import logging
+import os
+import queue
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+
+class LocalShardQueue:
+    """In-process shard queue used when the crawl runs on a single node."""
+
+    def __init__(self, urls, max_attempts=1):
+        self.max_attempts = max_attempts
+        self.pending = queue.Queue()
+        self.attempts = {}
+        for url in urls:
+            self.pending.put(url)
+
+    def claim(self):
+        try:
+            url = self.pending.get_nowait()
+        except queue.Empty:
+            return None
+        self.attempts[url] = self.attempts.get(url, 0) + 1
+        return url
+
+    def complete(self, url):
+        pass
+
+    def release(self, url):
+        """Puts a failed shard back unless it ran out of attempts."""
+        if self.attempts[url] < self.max_attempts:
+            self.pending.put(url)
+
+    def close(self):
+        pass
+
+
+class ShardQueue:
+    """
+    Shard queue stored in MongoDB and shared by every node of a distributed
+    crawl.
+
+    Each shard of a run is a document in ``collection``. Nodes claim pending
+    shards with a lease that a heartbeat thread keeps renewing while the
+    shard is crawled. Shards whose lease expired (the node died) are claimed
+    again by another node, up to ``max_attempts`` times. ``claim`` waits for
+    such shards and returns None once every shard of the run is finished.
+    """
+
+    def __init__(self, collection, run_id, node_id=None, lease_seconds=300,
+                 max_attempts=3, poll_interval=5, logger=None):
+        self.collection = collection
+        self.run_id = run_id
+        self.node_id = node_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.lock = threading.Lock()
+        self.held = set()
+        self.stopped = threading.Event()
+        self.heartbeat_thread = None
+
+    def _id(self, url):
+        return f'{self.run_id}:{url}'
+
+    def _lease_expiry(self):
+        return datetime.now(timezone.utc) + timedelta(
+            seconds=self.lease_seconds)
+
+    def seed(self, urls):
+        """Adds the shards of the run. Safe to call from every node."""
+        for url in urls:
+            self.collection.update_one(
+                {'_id': self._id(url)},
+                {'$setOnInsert': {
+                    'run_id': self.run_id,
+                    'url': url,
+                    'status': 'pending',
+                    'attempts': 0,
+                    'created_at': datetime.now(timezone.utc),
+                }},
+                upsert=True,
+            )
+        self.collection.create_index([('run_id', 1), ('status', 1)])
+
+    def start(self):
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat)
+        self.heartbeat_thread.daemon = True
+        self.heartbeat_thread.start()
+
+    def claim(self):
+        while not self.stopped.is_set():
+            now = datetime.now(timezone.utc)
+            shard = self.collection.find_one_and_update(
+                {
+                    'run_id': self.run_id,
+                    'attempts': {'$lt': self.max_attempts},
+                    '$or': [
+                        {'status': 'pending'},
+                        {'status': 'leased', 'lease_expires': {'$lt': now}},
+                    ],
+                },
+                {
+                    '$set': {
+                        'status': 'leased',
+                        'owner': self.node_id,
+                        'lease_expires': self._lease_expiry(),
+                    },
+                    '$inc': {'attempts': 1},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if shard is not None:
+                with self.lock:
+                    self.held.add(shard['url'])
+                self.logger.info(
+                    f"Claimed shard {shard['url']} "
+                    f"(attempt {shard['attempts']})")
+                return shard['url']
+
+            if not self._unfinished():
+                return None
+            # Other nodes hold the remaining shards; wait in case one of
+            # their leases expires
+            self.stopped.wait(self.poll_interval)
+        return None
+
+    def _unfinished(self):
+        return self.collection.count_documents({
+            'run_id': self.run_id,
+            'attempts': {'$lt': self.max_attempts},
+            'status': {'$in': ['pending', 'leased']},
+        }, limit=1)
+
+    def complete(self, url):
+        self._finish(url, {'status': 'done',
+                           'finished_at': datetime.now(timezone.utc)})
+
+    def release(self, url):
+        """Gives a failed shard back so it can be claimed again."""
+        self._finish(url, {'status': 'pending'})
+
+    def _finish(self, url, update):
+        with self.lock:
+            self.held.discard(url)
+        result = self.collection.update_one(
+            {'_id': self._id(url), 'owner': self.node_id,
+             'status': 'leased'},
+            {'$set': update},
+        )
+        if not result.matched_count:
+            self.logger.warning(
+                f'Lease on shard {url} was lost before it finished')
+
+    def _heartbeat(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                held = list(self.held)
+            for url in held:
+                try:
+                    result = self.collection.update_one(
+                        {'_id': self._id(url), 'owner': self.node_id,
+                         'status': 'leased'},
+                        {'$set': {'lease_expires': self._lease_expiry()}},
+                    )
+                except Exception as e:
+                    self.logger.error(f'Heartbeat for shard {url} failed: {e}')
+                    continue
+                if not result.matched_count:
+                    self.logger.warning(
+                        f'Lease on shard {url} was taken by another node')
+                    with self.lock:
+                        self.held.discard(url)
+
+    def close(self):
+        self.stopped.set()
@@ -1,18 +1,89 @@
 import scrapy
-from scrapy.http import HtmlResponse
-import sys
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from jobbank.items import JobbankItem
-from jobbank.transformations import clean_text, transform_title, transform_job_link
+from scrapy import signals
+from scrapy.http import FormRequest, HtmlResponse
+from jobbank.browser import pool_from_settings
+from jobbank.capture import PageArchive
+from jobbank.checkpoint import Checkpoint, PageAcks
+from jobbank.instrumentation import timed
+from jobbank.items import (JOBBANK_SOURCE, JobDetailItem, JobRecord,
+                           SeenPostingsItem)
+from jobbank.parsing import parse_listings
+from jobbank.seen import SeenIndex
+from jobbank.shardqueue import LocalShardQueue, ShardQueue
+from jobbank.transformations import clean_text
+from jobbank.waits import ResultsWaiter
+from jobbank.writer import content_hash
+from scrapy.utils.defer import maybe_deferred_to_future
 from scrapy.utils.project import get_project_settings
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from twisted.internet import threads
+from pymongo import MongoClient
+from selenium.common.exceptions import (
+    ElementClickInterceptedException, ElementNotInteractableException,
+    StaleElementReferenceException, WebDriverException)
+from urllib.parse import parse_qsl, urljoin, urlparse
+import collections
+import concurrent.futures
+import functools
+import multiprocessing
 import queue
+import re
 import signal
+import threading
+
+
+# Returns the total number of result articles on the page together with the
+# markup of the articles appended after the first ``arguments[0]`` ones.
+NEW_ARTICLES_SCRIPT = """
+var articles = document.querySelectorAll('article.action-buttons');
+var start = arguments[0] <= articles.length ? arguments[0] : 0;
+var html = [];
+for (var i = start; i < articles.length; i++) {
+    html.push(articles[i].outerHTML);
+}
+return [articles.length, start, html.join('')];
+"""
+
+# Items produced by the shard workers but not yet handed to Scrapy
+SHARD_RESULTS_MAX = 1000
+
+# selenium.webdriver.common.by.By.ID, spelled out so that selenium.webdriver
+# is only imported once a browser is started
+BY_ID = 'id'
+
+# Put on the results queue by a shard worker when it runs out of shards
+_WORKER_DONE = object()
+
+# Follow the items of a result page, and of a finished shard, on the
+# results queue, so the checkpoint advances once the items are spooled
+_PageDone = collections.namedtuple('_PageDone', 'pages last_link')
+_SHARD_DONE = object()
+
+# Detail page fields, mostly marked with their schema.org JobPosting property
+DETAIL_SELECTORS = {
+    'description': '.job-posting-detail-requirements ::text',
+    'noc_code': '.noc-no ::text',
+    'hours': '[property="workHours"] ::text',
+    'employment_terms': '[property="employmentType"] ::text',
+    'vacancies': '.job-posting-brief ::text',
+}
+NOC_CODE_RE = re.compile(r'\b\d{4,5}\b')
+VACANCIES_RE = re.compile(r'(\d+)\s+vacanc', re.IGNORECASE)
+
+
+def _drain(results, timeout=1.0):
+    """
+    Waits up to ``timeout`` seconds for the next result, then takes whatever
+    else is ready.
+    """
+    try:
+        batch = [results.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while True:
+        try:
+            batch.append(results.get_nowait())
+        except queue.Empty:
+            return batch
 
 
 class JobbankSpider(scrapy.Spider):
@@ -20,131 +91,716 @@ class JobbankSpider(scrapy.Spider):
     start_urls = ['https://www.jobbank.gc.ca/jobsearch/']
     base_url = 'https://www.jobbank.gc.ca'
     unwanted_text = 'Unwanted Text Here'
-    canada_logo_svg = 'https://upload.wikimedia.org/wikipedia/commons/thumb/d/d9/Flag_of_Canada_%28Pantone%29.svg/1200px-Flag_of_Canada_%28Pantone%29.svg.png'
-    country = 'Canada'
+    canada_logo_svg = JOBBANK_SOURCE['logo']
+    country = JOBBANK_SOURCE['country']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, engine=None, start_url=None, run_id=None,
+                 browser_pool=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         # Retrieve settings
         settings = get_project_settings()
-        chrome_binary_location = settings.get('CHROME_BINARY_LOCATION')
-        chrome_driver_path = settings.get('CHROME_DRIVER_EXECUTABLE_PATH')
+        self.incremental_parse = settings.getbool(
+            'JOBBANK_INCREMENTAL_PARSE', True)
+        self.http_loader_path = settings.get(
+            'JOBBANK_HTTP_LOADER_PATH', '/jobsearch/job_search_loader.xhtml')
+        self.http_max_pages = settings.getint('JOBBANK_HTTP_MAX_PAGES', 0)
+
+        # Result pages can be parsed in worker processes while the browsers
+        # keep paging. Spawned rather than forked, as the crawl runs threads.
+        parse_processes = settings.getint('JOBBANK_PARSE_PROCESSES', 0)
+        self.parse_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=parse_processes,
+            mp_context=multiprocessing.get_context('spawn'),
+        ) if parse_processes > 0 else None
 
-        options = Options()
-        if chrome_binary_location:
-            options.binary_location = chrome_binary_location
+        # Parsed result pages are archived, so a parser or transformation
+        # change can be applied by replaying them instead of crawling again
+        capture_dir = settings.get('JOBBANK_CAPTURE_DIR')
+        self.capture = PageArchive(capture_dir) if capture_dir else None
 
-        self.service = Service(executable_path=chrome_driver_path)
-        self.driver = webdriver.Chrome(service=self.service, options=options)
+        # Detail pages are fetched with plain requests for every posting
+        # whose listing changed since it was last enriched. The pipeline
+        # fills ``enriched`` with the listing hash of the stored details.
+        self.enrich_details = settings.getbool('JOBBANK_ENRICH_DETAILS', True)
+        self.enriched = {}
+        self.detail_download_slot = settings.get(
+            'JOBBANK_DETAIL_DOWNLOAD_SLOT')
 
-        # Register signal handlers for graceful shutdown
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+        # Postings stored by previous runs are skipped, and paging stops
+        # after a run of consecutive known postings
+        seen_index_path = settings.get('JOBBANK_SEEN_INDEX_PATH')
+        self.seen_index = SeenIndex(
+            seen_index_path) if seen_index_path else None
+        self.early_stop_after = settings.getint(
+            'JOBBANK_EARLY_STOP_AFTER', 0)
+
+        # 'selenium' drives Chrome, 'http' replays the pagination requests
+        self.engine = engine or settings.get('JOBBANK_ENGINE', 'selenium')
+        if self.engine not in ('selenium', 'http'):
+            raise ValueError(f"Unknown engine: {self.engine}")
+
+        # Allow pointing the spider at another host (e.g. a local stub server)
+        if start_url:
+            self.start_urls = [start_url]
+            parsed = urlparse(start_url)
+            self.base_url = f'{parsed.scheme}://{parsed.netloc}'
+
+        # Each shard is a separate search crawled by its own browser
+        shards = settings.getlist('JOBBANK_SHARDS')
+        if shards:
+            search_url = urljoin(self.start_urls[0], 'jobsearch')
+            self.start_urls = [f'{search_url}?{shard}' for shard in shards]
+
+        # Chrome is only started once a page has to be rendered, unless the
+        # launcher already warmed up a pool
+        self.project_settings = settings
+        self.browser_pool = browser_pool
+        self.shard_retries = settings.getint('JOBBANK_SHARD_RETRIES', 1)
+
+        # Waits end on in-page events; timeouts follow the observed latency
+        self.waiter = ResultsWaiter(
+            min_timeout=settings.getfloat('JOBBANK_WAIT_MIN_TIMEOUT', 1.0),
+            max_timeout=settings.getfloat('JOBBANK_WAIT_MAX_TIMEOUT', 10.0),
+            multiplier=settings.getfloat('JOBBANK_WAIT_TIMEOUT_MULTIPLIER', 3.0),
+        )
+
+        # Nodes crawling with the same run id share their shards through
+        # a queue stored in MongoDB
+        self.run_id = run_id
+        self.shard_client = None
+        if run_id and self.engine != 'selenium':
+            raise ValueError('Distributed crawls require the selenium engine')
+
+        # Progress of every shard, so an interrupted crawl resumes paging
+        # where it stopped
+        checkpoint_path = settings.get('JOBBANK_CHECKPOINT_PATH')
+        self.checkpoint = Checkpoint(
+            checkpoint_path,
+            interval=settings.getfloat('JOBBANK_CHECKPOINT_INTERVAL', 10),
+        ) if checkpoint_path else None
+        self.page_acks = None
+        self.stopping = threading.Event()
 
         # Initialize queue for items
         self.item_queue = queue.Queue()
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider._engine_started,
+                                signal=signals.engine_started)
+        for signal_ in (signals.item_scraped, signals.item_dropped,
+                        signals.item_error):
+            crawler.signals.connect(spider._item_handled, signal=signal_)
+        return spider
+
+    def _engine_started(self):
+        # CrawlerProcess installs its shutdown handlers once the reactor
+        # runs, so ours are chained onto them on the next reactor turn
+        from twisted.internet import reactor
+        reactor.callLater(0, self._install_signal_handlers)
+
+    def _item_handled(self, item):
+        # The pipeline spooled the item, or it never will
+        if self.page_acks is not None:
+            self.page_acks.ack(item)
+
+    def _install_signal_handlers(self):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, functools.partial(
+                self.signal_handler, previous=signal.getsignal(sig)))
+
+    def _ensure_browser_pool(self):
+        if self.browser_pool is None:
+            self.browser_pool = pool_from_settings(
+                self.project_settings, logger=self.logger)
+        return self.browser_pool
+
+    async def start(self):
+        # Scrapy >= 2.13 calls start(); its default only reads start_urls
+        for request in self.start_requests():
+            yield request
+
     def start_requests(self):
-        for url in self.start_urls:
-            yield scrapy.Request(url=url, callback=self.parse)
+        if self.engine == 'http':
+            for i, url in enumerate(self.start_urls):
+                # Each search keeps its own session cookies
+                yield scrapy.Request(url=url, callback=self.parse_http,
+                                     meta={'cookiejar': i, 'page': 1,
+                                           'dont_cache': True})
+        else:
+            # A single callback drives the browser pool over every shard
+            yield scrapy.Request(url=self.start_urls[0], callback=self.parse,
+                                 meta={'shards': list(self.start_urls),
+                                       'dont_cache': True})
+
+    async def parse(self, response):
+        shards = response.meta.get('shards', [response.url])
+        if self.checkpoint is not None and not self.run_id:
+            # Shards finished before the crawl was interrupted
+            shards = [url for url in shards
+                      if not self.checkpoint.is_done(url)]
+        if self.run_id:
+            shard_queue = self._distributed_shard_queue(shards)
+        else:
+            shard_queue = LocalShardQueue(
+                shards, max_attempts=self.shard_retries + 1)
+        try:
+            async for item in self._crawl_shards(shard_queue):
+                yield item
+                detail_request = self._detail_request(item)
+                if detail_request is not None:
+                    yield detail_request
+        finally:
+            shard_queue.close()
+
+    def _distributed_shard_queue(self, shards):
+        settings = self.project_settings
+        self.shard_client = MongoClient(settings.get('MONGO_URI'))
+        collection = self.shard_client[settings.get('MONGO_DATABASE')][
+            settings.get('JOBBANK_SHARD_COLLECTION', 'shards')]
+        shard_queue = ShardQueue(
+            collection,
+            self.run_id,
+            node_id=settings.get('JOBBANK_NODE_ID'),
+            lease_seconds=settings.getint('JOBBANK_SHARD_LEASE_SECONDS', 300),
+            max_attempts=self.shard_retries + 1,
+            logger=self.logger,
+        )
+        shard_queue.seed(shards)
+        shard_queue.start()
+        self.logger.info(
+            f'Joined run {self.run_id} as node {shard_queue.node_id}')
+        return shard_queue
+
+    def closed(self, reason):
+        if self.browser_pool is not None:
+            self.browser_pool.close()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+        if self.capture is not None:
+            self.capture.close()
+            self.logger.info(f'Captured {self.capture.count} result pages '
+                             f'to {self.capture.path}')
+        if self.shard_client is not None:
+            self.shard_client.close()
+        if self.seen_index is not None:
+            self.seen_index.save()
+            self.logger.info(f'Seen index holds {len(self.seen_index)} postings')
+        if self.checkpoint is not None:
+            if reason == 'finished' and self._all_shards_done():
+                self.checkpoint.clear()
+            else:
+                self.checkpoint.save()
+                self.logger.info(
+                    f'Saved checkpoint to {self.checkpoint.path} ({reason})')
+
+    def _all_shards_done(self):
+        """
+        False if a shard of a local Selenium crawl was given up on, so its
+        progress is kept for the next run.
+        """
+        if self.engine != 'selenium' or self.run_id:
+            return True
+        return all(self.checkpoint.is_done(url) for url in self.start_urls)
+
+    # ------------------------------------------------------------------
+    # HTTP engine
+    # ------------------------------------------------------------------
+
+    def parse_http(self, response):
+        """
+        Parses a search results page fetched without a browser and schedules
+        the request the "Show More Results" button would have sent.
+        """
+        page = response.meta['page']
+        progress = response.meta.setdefault('progress', {'known_run': 0})
+        response, view_state = self._unwrap_partial_response(response)
+
+        if not response.css('article.action-buttons'):
+            if page == 1:
+                # Unexpected markup (or a block page): let Chrome handle it
+                self.logger.warning(
+                    f'No results in HTTP response for {response.url}, '
+                    'falling back to Selenium')
+                yield scrapy.Request(url=response.url, callback=self.parse,
+                                     dont_filter=True,
+                                     meta={'dont_cache': True})
+            return
+
+        if self.capture is not None:
+            self.capture.add(response.text,
+                             response.meta.get('search_url', response.url),
+                             page)
+        with timed(self, 'parse_jobs'):
+            items = list(self._parse_jobs(response, progress))
+        for item in items:
+            yield item
+            detail_request = self._detail_request(item)
+            if detail_request is not None:
+                yield detail_request
+
+        if self.http_max_pages and page >= self.http_max_pages:
+            return
+        if self._reached_known_postings(progress):
+            return
+        if page == 1 and not response.css('#moreresultbutton'):
+            return
+
+        yield self._next_page_request(response, page + 1, view_state)
+
+    def _next_page_request(self, response, page, view_state):
+        search_url = response.meta.get('search_url', response.url)
+        params = dict(parse_qsl(urlparse(search_url).query))
+        params['page'] = str(page)
+        meta = {
+            'cookiejar': response.meta.get('cookiejar'),
+            'page': page,
+            'search_url': search_url,
+            'view_state': view_state,
+            'progress': response.meta['progress'],
+            'dont_cache': True,
+        }
+        url = urljoin(self.base_url, self.http_loader_path)
+
+        if view_state:
+            # JSF keeps the search in the server-side view, so the view state
+            # has to travel with every request of the session
+            params.update({
+                'javax.faces.ViewState': view_state,
+                'javax.faces.partial.ajax': 'true',
+                'javax.faces.source': 'moreresultbutton',
+            })
+            return FormRequest(url=url, formdata=params,
+                               callback=self.parse_http, meta=meta)
+
+        return FormRequest(url=url, method='GET', formdata=params,
+                           callback=self.parse_http, meta=meta)
+
+    def _unwrap_partial_response(self, response):
+        """
+        Returns the HTML carried by ``response`` and the current JSF view
+        state. JSF partial responses wrap the new markup in CDATA sections.
+        """
+        view_state = response.meta.get('view_state')
+        body = response.text
+
+        if '<partial-response' not in body[:500]:
+            view_state = response.css(
+                'input[name="javax.faces.ViewState"]::attr(value)'
+            ).get(view_state)
+            return response, view_state
+
+        updates = response.xpath('//update')
+        html = []
+        for update in updates:
+            content = update.xpath('text()').get('')
+            if 'ViewState' in update.attrib.get('id', ''):
+                view_state = content.strip()
+            else:
+                html.append(content)
+
+        response = HtmlResponse(
+            url=response.url,
+            body=f'<html><body>{"".join(html)}</body></html>',
+            encoding='utf-8',
+            request=response.request,
+        )
+        return response, view_state
+
+    # ------------------------------------------------------------------
+    # Detail pages
+    # ------------------------------------------------------------------
 
-    def parse(self, response):
-        self.driver.get(response.url)
-        self._close_popup_if_present()
-        self._scrape_pages()
+    def _detail_request(self, item):
+        """
+        Returns the request for the detail page of ``item``, or None if it
+        is not a posting or the stored details were fetched for the same
+        listing.
+        """
+        if not self.enrich_details or not isinstance(item, JobRecord):
+            return None
+        listing_hash = content_hash(item.to_document())
+        if self.enriched.get(item.job_link) == listing_hash:
+            self.crawler.stats.inc_value('details/skipped')
+            return None
+        meta = {'job_link': item.job_link, 'listing_hash': listing_hash}
+        if self.detail_download_slot:
+            # Opted in to a faster rate than the search pages'
+            meta['download_slot'] = self.detail_download_slot
+        return scrapy.Request(
+            url=item.job_link,
+            callback=self.parse_detail,
+            priority=-1,  # Result pages first
+            meta=meta,
+        )
 
-    def _close_popup_if_present(self):
+    def parse_detail(self, response):
+        item = JobDetailItem(job_link=response.meta['job_link'],
+                             listing_hash=response.meta['listing_hash'])
+        for field, selector in DETAIL_SELECTORS.items():
+            item[field] = clean_text(' '.join(response.css(selector).getall()))
+
+        noc_code = NOC_CODE_RE.search(item['noc_code'] or '')
+        item['noc_code'] = noc_code.group() if noc_code else None
+        vacancies = VACANCIES_RE.search(item['vacancies'] or '')
+        item['vacancies'] = int(vacancies.group(1)) if vacancies else None
+        yield item
+
+    # ------------------------------------------------------------------
+    # Selenium engine
+    # ------------------------------------------------------------------
+
+    async def _crawl_shards(self, shard_queue):
+        """
+        Crawls the shards claimed from ``shard_queue`` on the browser pool,
+        one worker thread per browser, and yields the items as the workers
+        produce them.
+        """
+        pool = self._ensure_browser_pool()
+
+        # Bounded, so the workers wait while Scrapy is busy with the items
+        results = queue.Queue(maxsize=SHARD_RESULTS_MAX)
+        if self.checkpoint is not None:
+            self.page_acks = PageAcks(self.checkpoint)
+        workers = pool.size
+        for _ in range(workers):
+            worker_thread = threading.Thread(
+                target=self._shard_worker, args=(pool, shard_queue, results))
+            worker_thread.daemon = True
+            worker_thread.start()
+
+        finished = 0
+        while finished < workers:
+            # Waiting off the reactor thread lets other requests (e.g. the
+            # detail pages) download while the browsers page
+            batch = await maybe_deferred_to_future(
+                threads.deferToThread(_drain, results))
+            for entry in batch:
+                if entry is _WORKER_DONE:
+                    finished += 1
+                    continue
+                url, item = entry
+                if isinstance(item, _PageDone):
+                    if self.page_acks is not None:
+                        self.page_acks.page_done(url, *item)
+                elif item is _SHARD_DONE:
+                    if self.page_acks is not None:
+                        self.page_acks.shard_done(url)
+                else:
+                    if self.page_acks is not None:
+                        self.page_acks.track(url, item)
+                    yield item
+
+    def _shard_worker(self, pool, shard_queue, results):
         try:
-            close_button = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable(
-                    (By.ID, 'j_id_36:outOfCanadaCloseBtn')
-                )
-            )
-            close_button.click()
-        except (NoSuchElementException, TimeoutException) as e:
-            self.logger.debug(f'Popup close failed: {e}')
-
-    def _scrape_pages(self):
-        while True:
+            while not self.stopping.is_set():
+                url = shard_queue.claim()
+                if url is None:
+                    return
+
+                # ``driver`` changes if the browser is recycled mid-search
+                progress = {'known_run': 0, 'pages': 0, 'driver': None,
+                            'driver_pages': 0}
+                broken = False
+                try:
+                    progress['driver'] = pool.acquire()
+                    for item in self._scrape_pages(progress['driver'], url,
+                                                   progress):
+                        results.put((url, item))
+                    if self.stopping.is_set():
+                        # Interrupted: the checkpoint says where to resume
+                        shard_queue.release(url)
+                    else:
+                        shard_queue.complete(url)
+                        results.put((url, _SHARD_DONE))
+                except WebDriverException as e:
+                    # The browser died: replace it and retry the shard
+                    broken = True
+                    self.logger.error(f'Browser failed on {url}: {e}')
+                    shard_queue.release(url)
+                except Exception:
+                    # E.g. Chrome could not be started: another worker may
+                    # still crawl the shard
+                    shard_queue.release(url)
+                    raise
+                finally:
+                    if progress['driver'] is not None:
+                        pool.release(progress['driver'],
+                                     progress['driver_pages'], broken)
+        except Exception as e:
+            self.logger.error(f'Error in shard worker: {e}')
+        finally:
+            results.put(_WORKER_DONE)
+
+    def _close_popup_if_present(self, driver):
+        # The popup is part of the initial markup, so by the time results are
+        # on the page it is either there or not coming
+        for close_button in driver.find_elements(
+                BY_ID, 'j_id_36:outOfCanadaCloseBtn'):
+            try:
+                if close_button.is_displayed():
+                    close_button.click()
+            except (ElementNotInteractableException,
+                    StaleElementReferenceException) as e:
+                self.logger.debug(f'Popup close failed: {e}')
+
+    def _scrape_pages(self, driver, url, progress):
+        """
+        Pages through the results of one search, yielding the items of
+        every page followed by a _PageDone. Browser failures are raised so
+        the caller can replace the driver.
+        """
+        state = self._open_search(driver, url)
+        if not state['count']:
+            self.logger.error(f'No results loaded for {url}')
+            return
+
+        # Number of articles already parsed
+        parsed_count = 0
+        resume_pages = self.checkpoint.pages(url) if self.checkpoint else 0
+        if resume_pages:
+            # The checkpointed pages were spooled, resume after them
+            state, parsed_count, skipped = self._fast_forward(
+                driver, url, resume_pages + 1, state)
+            progress['pages'] += skipped
+
+        # With a parse pool, the next page is requested before the current
+        # one is parsed
+        overlap = self.parse_pool is not None
+        while not self.stopping.is_set():
             try:
-                # Wait for the job listings to load
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located(
-                        (By.CSS_SELECTOR, 'article.action-buttons'))
-                )
-                response = HtmlResponse(
-                    url=self.driver.current_url,
-                    body=self.driver.page_source,
-                    encoding='utf-8',
-                )
-                self._parse_jobs(response)
-
-                # Click the 'Show More Results' button
-                if not self._click_more_button():
+                if self.incremental_parse:
+                    html, parsed_count = self._new_results_html(
+                        driver, parsed_count)
+                else:
+                    with timed(self, 'page_source'):
+                        html = driver.page_source
+                progress['pages'] += 1
+                progress['driver_pages'] += 1
+                if self.capture is not None:
+                    self.capture.add(html, url, progress['pages'])
+                if overlap:
+                    # Parsed while the next page loads; only the time spent
+                    # waiting for the parse holds up paging
+                    parsed = self._submit_parse(html)
+                    clicked = self._show_more(driver)
+                    with timed(self, 'parse_wait'):
+                        items = list(self._new_records(*parsed.result(),
+                                                       progress))
+                else:
+                    with timed(self, 'parse_jobs'):
+                        parsed = self._submit_parse(html)
+                        items = list(self._new_records(*parsed.result(),
+                                                       progress))
+                yield from items
+                records = [item for item in items
+                           if isinstance(item, JobRecord)]
+                yield _PageDone(progress['pages'],
+                                records[-1].job_link if records else None)
+
+                if self._reached_known_postings(progress):
+                    break
+                if not overlap:
+                    clicked = self._show_more(driver)
+                if not clicked:
+                    break
+
+                # Returns as soon as the new articles are appended
+                with timed(self, 'wait_articles'):
+                    previous = state['count']
+                    state = self.waiter.wait_for_results(driver, previous)
+                if state['count'] <= previous:
+                    if state['timed_out']:
+                        self.logger.error(
+                            f'No new results loaded for {url} after '
+                            f'{previous} postings')
                     break
 
+                if self.browser_pool.due_for_recycling(
+                        driver, progress['driver_pages']):
+                    driver, state, parsed_count = self._recycle_driver(
+                        driver, url, progress)
+
+            except WebDriverException:
+                raise
             except Exception as e:
                 self.logger.error(f"Error in _scrape_pages: {e}")
                 break
 
-        self.driver.quit()
+    def _open_search(self, driver, url):
+        """Loads the first result page of ``url``; returns the wait state."""
+        driver.get(url)
+        with timed(self, 'wait_articles'):
+            state = self.waiter.wait_for_results(driver, 0)
+        if state['count']:
+            self._close_popup_if_present(driver)
+        return state
 
-    def _parse_jobs(self, response):
-        job_postings = response.css('article.action-buttons')
+    def _recycle_driver(self, driver, url, progress):
+        """
+        Replaces ``driver`` in the middle of a search, as a long search
+        would otherwise keep a bloated browser until its end. The new
+        driver loads the result pages reached so far, up to the one not
+        parsed yet.
 
-        for job in job_postings:
-            try:
-                title = job.css('h3.title span.noctitle::text').get()
-                date = job.css('ul.list-unstyled li.date::text').get().strip()
-                business = job.css('ul.list-unstyled li.business::text').get()
-                location = job.css(
-                    'ul.list-unstyled li.location::text').getall()
-                salary = job.css('ul.list-unstyled li.salary::text').get()
-                job_link = job.css('a.resultJobItem::attr(href)').get()
-
-                location_text = ' '.join(location).strip(
-                ) if location else 'Not specified'
-
-                item = JobbankItem(
-                    title=transform_title(
-                        clean_text(title), self.unwanted_text),
-                    date=date,
-                    business=clean_text(business),
-                    location=location_text,
-                    salary=clean_text(salary),
-                    job_link=transform_job_link(job_link, self.base_url),
-                    logo=self.canada_logo_svg,
-                    source='Job bank',
-                    country=self.country,
-                )
-
-                self.item_queue.put(item)
-            except Exception as e:
-                self.logger.error(f"Error parsing job details: {e}")
+        Returns the new driver, its wait state and the number of articles
+        already parsed.
+        """
+        pages = progress['pages'] + 1
+        progress['driver'] = None  # Quit, even if no new driver starts
+        driver = progress['driver'] = self.browser_pool.recycle(driver)
+        progress['driver_pages'] = 0
+        state = self._open_search(driver, url)
+        if not state['count']:
+            raise WebDriverException(
+                f'No results loaded for {url} on a recycled browser')
+        # Pages loaded again do not count towards the recycling limit, or
+        # every page past it would start another browser
+        state, parsed_count, _ = self._fast_forward(driver, url, pages, state)
+        return driver, state, parsed_count
 
-    def _click_more_button(self):
-        try:
-            more_button = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable((By.ID, 'moreresultbutton'))
-            )
-            more_button.click()
-            return True
-        except (NoSuchElementException, TimeoutException) as e:
-            self.logger.debug(f'Show more results button click failed: {e}')
+    def _show_more(self, driver):
+        """Clicks 'Show More Results' once the writer has room."""
+        self._wait_for_writer()
+        with timed(self, 'show_more'):
+            return self._click_more_button(driver)
+
+    def _wait_for_writer(self):
+        """Holds paging while the pipeline's queue is above its watermarks."""
+        wait_for_room = getattr(self.item_queue, 'wait_for_room', None)
+        if wait_for_room is None or wait_for_room(0):
+            return
+        self.logger.info('Writer is lagging, pausing paging')
+        with timed(self, 'backpressure'):
+            while not self.stopping.is_set() and not wait_for_room(1):
+                pass
+        self.logger.info('Resuming paging')
+
+    def _fast_forward(self, driver, url, pages, state):
+        """
+        Loads the first ``pages`` result pages, to parse only the last one.
+
+        Returns the last wait state, the number of articles before the last
+        page and the number of pages skipped.
+        """
+        self.logger.info(f'Resuming {url} at page {pages}')
+        loaded = 1
+        before_last = 0
+        while loaded < pages and not self.stopping.is_set():
+            if not self._click_more_button(driver):
+                break
+            previous = state['count']
+            state = self.waiter.wait_for_results(driver, previous)
+            if state['count'] <= previous:
+                break
+            before_last = previous
+            loaded += 1
+        return state, before_last, loaded - 1
+
+    def _new_results_html(self, driver, parsed_count):
+        """
+        Returns the markup of the articles appended to the result list since
+        the last call, so each "Show More" click costs the same regardless
+        of how many postings are already loaded.
+        """
+        with timed(self, 'page_source'):
+            total, start, html = driver.execute_script(
+                NEW_ARTICLES_SCRIPT, parsed_count)
+        if start != parsed_count:
+            # The result list shrank (e.g. the page was reloaded), start over
+            self.logger.warning(
+                f'Result list reset: {total} articles on page, '
+                f'{parsed_count} already parsed')
+        self.logger.debug(f'Extracting articles {start} to {total}')
+        return f'<html><body>{html}</body></html>', total
+
+    def _reached_known_postings(self, progress):
+        if not self.early_stop_after or self.seen_index is None:
             return False
+        if progress['known_run'] < self.early_stop_after:
+            return False
+        self.logger.info(
+            f"Stopping after {progress['known_run']} consecutive known "
+            "postings")
+        return True
 
-    def signal_handler(self, sig, frame):
-        try:
-            self.driver.quit()
-        except Exception as e:
-            self.logger.error(f'Error closing the driver: {e}')
+    def _submit_parse(self, html):
+        """
+        Parses the result articles of ``html``, in the parse pool if there
+        is one. Returns a future of parse_listings' result.
+        """
+        if self.parse_pool is not None:
+            return self.parse_pool.submit(
+                parse_listings, html, self.base_url, self.unwanted_text)
+        future = concurrent.futures.Future()
+        future.set_result(
+            parse_listings(html, self.base_url, self.unwanted_text))
+        return future
 
-        # Wait for all items in the queue to be processed
-        while not self.item_queue.empty():
-            try:
-                self.item_queue.get(block=False)
-            except queue.Empty:
-                pass
+    def _parse_jobs(self, response, progress=None):
+        """
+        Yields a JobRecord for every result article in ``response`` that is
+        not in the seen index, then a SeenPostingsItem of those that are.
+        """
+        records, errors = parse_listings(
+            response.text, self.base_url, self.unwanted_text)
+        return self._new_records(records, errors, progress)
+
+    def _new_records(self, records, errors, progress=None):
+        """
+        Logs the parse errors and yields the records not in the seen index,
+        followed by a SeenPostingsItem of the known ones so the pipeline
+        still updates their ``last_seen``. ``progress['known_run']`` counts
+        the known postings met in a row.
+        """
+        if progress is None:
+            progress = {'known_run': 0}
+        for error in errors:
+            self.logger.error(f"Error parsing job details: {error}")
+
+        known = []
+        for item in records:
+            if self.seen_index is not None and item.job_link in self.seen_index:
+                progress['known_run'] += 1
+                known.append(item.job_link)
+                continue
+            progress['known_run'] = 0
+            yield item
+        if known:
+            yield SeenPostingsItem(job_links=known)
+
+    def _click_more_button(self, driver):
+        """
+        Clicks "Show More Results" if the page still offers it. Returns
+        immediately on the last page, where the button is gone.
+        """
+        buttons = driver.find_elements(BY_ID, 'moreresultbutton')
+        if not buttons or not buttons[0].is_displayed():
+            self.logger.debug('No more results button, last page reached')
+            return False
+        try:
+            buttons[0].click()
+        except ElementClickInterceptedException:
+            # Something (e.g. a late popup) covers the button
+            driver.execute_script('arguments[0].click();', buttons[0])
+        except (ElementNotInteractableException,
+                StaleElementReferenceException) as e:
+            self.logger.debug(f'Show more results button click failed: {e}')
+            return False
+        return True
 
-        sys.exit(0)
+    def signal_handler(self, sig, frame, previous=None):
+        """
+        Stops the shard workers after the page they are on, then hands the
+        signal to Scrapy's handler, which closes the spider once the
+        pipeline wrote the queued items. A second signal makes Scrapy stop
+        at once; the spool and the checkpoint keep what is needed to resume.
+        """
+        self.logger.info('Shutdown requested, finishing the current pages')
+        self.stopping.set()
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+        if callable(previous):
+            previous(sig, frame)
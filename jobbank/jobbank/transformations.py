@@ -1,6 +1,37 @@
 from datetime import datetime
+from functools import lru_cache
 import logging
-from urllib.parse import urljoin
+import re
+from urllib.parse import urljoin, urlparse, urlunparse
+
+
+# "$25.00 hourly", "$55,000.00 to $65,000.00 annually", ...
+SALARY_AMOUNT_RE = re.compile(r'\$\s*(\d[\d,]*(?:\.\d+)?)')
+SALARY_PERIOD_RE = re.compile(
+    r'\b(hourly|hour|daily|day|bi-?weekly|weekly|week|monthly|month|'
+    r'annually|annual|yearly|year)\b', re.IGNORECASE)
+SALARY_PERIODS = {
+    'hourly': 'hourly', 'hour': 'hourly',
+    'daily': 'daily', 'day': 'daily',
+    'biweekly': 'biweekly', 'bi-weekly': 'biweekly',
+    'weekly': 'weekly', 'week': 'weekly',
+    'monthly': 'monthly', 'month': 'monthly',
+    'annually': 'annual', 'annual': 'annual', 'yearly': 'annual',
+    'year': 'annual',
+}
+# Periods per year, assuming full-time work (40 hours, 5 days a week)
+PERIODS_PER_YEAR = {
+    'hourly': 2080, 'daily': 260, 'weekly': 52, 'biweekly': 26,
+    'monthly': 12, 'annual': 1,
+}
+SALARY_FIELDS = ('salary_min', 'salary_max', 'salary_period',
+                 'salary_annual_min', 'salary_annual_max')
+
+# "Toronto (ON)"
+LOCATION_RE = re.compile(r'^(?P<city>.*?)\s*\((?P<province>[A-Z]{2})\)$')
+PROVINCE_CODES = frozenset(('AB', 'BC', 'MB', 'NB', 'NL', 'NS', 'NT', 'NU',
+                            'ON', 'PE', 'QC', 'SK', 'YT'))
+LOCATION_FIELDS = ('city', 'province')
 
 
 class InvalidDateFormat(Exception):
@@ -22,28 +53,88 @@ def transform_title(title, unwanted_text):
 
 def transform_date(date_str):
     if not isinstance(date_str, str):
-        raise TypeError(f"Expected a string for date, but got {
-                        type(date_str)}: {date_str}")
+        raise TypeError(f"Expected a string for date, but got "
+                        f"{type(date_str)}: {date_str}")
 
     try:
-        # Debug log the received date string
-        logging.debug(f"Received date_str for transformation: '{date_str}'")
-
-        # Adjust date parsing to handle 'Month Day, Year' format
-        date_obj = datetime.strptime(date_str, '%B %d, %Y')
-        return date_obj.strftime('%Y-%m-%d')  # Return as 'YYYY-MM-DD'
+        return normalize_date(date_str)[0]  # Return as 'YYYY-MM-DD'
     except ValueError:
         # Log the error with the problematic date string
-        logging.error(f'Invalid date format: {
-                      date_str}. Expected format: "Month Day, Year"')
-        raise ValueError(f'Invalid date format: {
-                         date_str}. Expected format: "Month Day, Year"')
+        logging.error(f'Invalid date format: {date_str}. '
+                      'Expected format: "Month Day, Year"')
+        raise
+
+
+# Postings share a few dozen distinct dates, so each one is parsed once
+@lru_cache(maxsize=1024)
+def normalize_date(date_str):
+    """
+    Parses a 'Month Day, Year' date and returns it both as a 'YYYY-MM-DD'
+    string and as a datetime. Raises ValueError for other formats.
+    """
+    try:
+        date_obj = datetime.strptime(clean_text(date_str), '%B %d, %Y')
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid date format: {date_str}. '
+                         'Expected format: "Month Day, Year"') from None
+    return date_obj.strftime('%Y-%m-%d'), date_obj
+
+
+@lru_cache(maxsize=4096)
+def normalize_salary(salary):
+    """
+    Parses a salary into ``(min, max, period, annual_min, annual_max)``.
+    Unparseable parts are None; annual values need a known period.
+    """
+    amounts = [float(amount.replace(',', ''))
+               for amount in SALARY_AMOUNT_RE.findall(salary or '')]
+    if not amounts:
+        return None, None, None, None, None
+    low, high = min(amounts), max(amounts)
+
+    period = SALARY_PERIOD_RE.search(salary)
+    if period is None:
+        return low, high, None, None, None
+    period = SALARY_PERIODS[period.group(1).lower()]
+    factor = PERIODS_PER_YEAR[period]
+    return low, high, period, round(low * factor, 2), round(high * factor, 2)
+
+
+# Postings come from a few thousand distinct places
+@lru_cache(maxsize=8192)
+def normalize_location(location):
+    """Splits "City (PR)" into ``(city, province)``, None when unknown."""
+    match = LOCATION_RE.match(clean_text(location) or '')
+    if match is None or match.group('province') not in PROVINCE_CODES:
+        return None, None
+    return match.group('city') or None, match.group('province')
+
+
+def add_salary_fields(item):
+    item.update(zip(SALARY_FIELDS, normalize_salary(item.get('salary'))))
+    return item
+
+
+def add_location_fields(item):
+    item.update(zip(LOCATION_FIELDS, normalize_location(item.get('location'))))
+    return item
 
 
 def transform_job_link(link, base_url):
+    """
+    Returns the absolute, normalized form of ``link``, the key postings are
+    stored under.
+    """
     if not link.startswith('http'):
         link = urljoin(base_url, link)
-    return link
+    return normalize_job_link(link)
+
+
+def normalize_job_link(link):
+    """Drops the session id, query string and fragment from a job link."""
+    parsed = urlparse(link)
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(),
+                       parsed.path.rstrip('/'), '', '', ''))
 
 
 def add_source(item):
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import deque
+
+# Resolves as soon as the result list grows past ``arguments[0]`` articles.
+# A MutationObserver re-checks on every DOM change instead of polling. If
+# the "Show More Results" button goes away without new results, the wait
+# ends after a short settle delay (``arguments[2]`` ms) since there is
+# nothing left to load. Gives up after ``arguments[1]`` ms.
+WAIT_FOR_RESULTS_SCRIPT = """
+var previous = arguments[0];
+var timeoutMs = arguments[1];
+var settleMs = arguments[2];
+var done = arguments[arguments.length - 1];
+
+function state() {
+    var button = document.getElementById('moreresultbutton');
+    return {
+        count: document.querySelectorAll('article.action-buttons').length,
+        has_more: !!button && button.offsetParent !== null && !button.disabled,
+        timed_out: false
+    };
+}
+
+var current = state();
+if (current.count > previous) {
+    done(current);
+    return;
+}
+
+var finished = false;
+var settleTimer = null;
+var observer = null;
+var timer = null;
+
+function finish(result) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearTimeout(timer);
+    clearTimeout(settleTimer);
+    done(result);
+}
+
+function check() {
+    var current = state();
+    if (current.count > previous) {
+        finish(current);
+    } else if (!current.has_more && previous > 0 && settleTimer === null) {
+        settleTimer = setTimeout(function () { finish(state()); }, settleMs);
+    }
+}
+
+observer = new MutationObserver(check);
+observer.observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true,
+    attributeFilter: ['style', 'class', 'disabled']
+});
+timer = setTimeout(function () {
+    var current = state();
+    current.timed_out = true;
+    finish(current);
+}, timeoutMs);
+check();
+"""
+
+
+class ResultsWaiter:
+    """
+    Waits for search results to land using in-page events, with a timeout
+    adapted to the latencies observed so far.
+
+    The timeout is ``multiplier`` times the slowest of the last ``window``
+    successful waits, kept between ``min_timeout`` and ``max_timeout``
+    seconds. Until latencies are known it is ``max_timeout``.
+    """
+
+    def __init__(self, min_timeout=1.0, max_timeout=10.0, multiplier=3.0,
+                 window=50, settle=0.5):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+        self.settle = settle
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+
+    def timeout(self):
+        with self.lock:
+            if not self.latencies:
+                return self.max_timeout
+            slowest = max(self.latencies)
+        return min(self.max_timeout,
+                   max(self.min_timeout, slowest * self.multiplier))
+
+    def wait_for_results(self, driver, previous_count):
+        """
+        Returns ``{'count', 'has_more', 'timed_out'}`` once more than
+        ``previous_count`` articles are on the page, once the result list
+        is exhausted, or when the timeout expires.
+        """
+        state = self._wait(driver, previous_count, self.timeout())
+        if state['timed_out'] and state['has_more'] and \
+                self.timeout() < self.max_timeout:
+            # The adaptive timeout may just be too tight for a slow response
+            state = self._wait(driver, previous_count, self.max_timeout)
+        return state
+
+    def _wait(self, driver, previous_count, timeout):
+        driver.set_script_timeout(timeout + 5)
+        start = time.monotonic()
+        state = driver.execute_async_script(
+            WAIT_FOR_RESULTS_SCRIPT, previous_count, int(timeout * 1000),
+            int(self.settle * 1000))
+        if state['count'] > previous_count:
+            with self.lock:
+                self.latencies.append(time.monotonic() - start)
+        return state
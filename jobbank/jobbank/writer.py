@@ -0,0 +1,528 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+# Fields whose changes are worth a write; everything else is either constant
+# per source or derived from these
+HASHED_FIELDS = ('title', 'date', 'business', 'location', 'salary')
+
+# Write errors worth sending again: duplicate keys from two upserts of the
+# same new posting racing each other, where the next attempt finds the
+# document. Everything else is rejected for good.
+RETRYABLE_CODES = {11000}
+
+
+def content_hash(item):
+    """Returns a stable digest of the business-relevant fields of ``item``."""
+    values = json.dumps([item.get(field) for field in HASHED_FIELDS],
+                        ensure_ascii=False, default=str)
+    return hashlib.blake2b(values.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class BulkWriter:
+    """
+    Buffers upserts and sends them to MongoDB as unordered bulk writes.
+
+    Batches are flushed when ``batch_size`` operations are buffered or when
+    ``flush_interval`` seconds have passed since the last flush. The buffer
+    is shared, so several threads can add and flush concurrently.
+    ``on_written`` is called with the job links of every batch once they
+    are stored, ``before_write`` before every batch is sent, and
+    ``observe`` with the latency of every batch.
+
+    Documents carry a ``content_hash`` of their business-relevant fields.
+    Postings whose hash matches the one already stored (see ``warm``) are
+    not rewritten; only their ``last_seen`` is updated when
+    ``touch_unchanged`` is set.
+
+    Detail page fields added with ``add_detail`` are merged into the
+    posting's document in the same batches. They are never upserted: the
+    fields of a posting not stored yet wait in ``pending_details`` until
+    its own write succeeds.
+
+    Replays of captured pages set ``rewrite``, so unchanged postings are
+    written again with the current transformations, and clear
+    ``mark_seen``, so ``last_seen`` is only set on postings not stored yet.
+
+    Batches that fail because the server is unreachable are retried up to
+    ``retries`` times, waiting ``retry_delay`` seconds and doubling the wait
+    after every attempt (at most ``retry_max_delay``). The upserts are
+    idempotent, so a partially applied batch can be sent again. Batches
+    still failing after that stay in ``unsaved`` and are sent again, a
+    batch at a time, before anything new. Once they fill a batch the
+    writer is ``backlogged`` and callers should stop adding, so the items
+    wait in the pipeline's queue instead of here. Operations the server
+    rejects are logged and dropped, except duplicate key errors from racing
+    upserts, which are sent again up to ``retries`` times.
+    """
+
+    def __init__(self, collection, batch_size=500, flush_interval=2.0,
+                 stats=None, logger=None, on_written=None,
+                 touch_unchanged=True, observe=None, retries=5,
+                 retry_delay=0.5, retry_max_delay=30.0, rewrite=False,
+                 mark_seen=True, before_write=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.logger = logger or logging.getLogger(__name__)
+        self.on_written = on_written
+        self.touch_unchanged = touch_unchanged
+        self.observe = observe
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.rewrite = rewrite
+        self.mark_seen = mark_seen
+        self.before_write = before_write
+
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.writing = 0  # Batches being written
+        self.unsaved = []  # Buffer entries whose write failed
+        # Job links of items left in the spool unwritten at shutdown
+        self.held = set()
+        # job_link -> duplicate key errors of its last writes
+        self.conflicts = {}
+
+        # job_link -> content hash of the stored document
+        self.known_hashes = {}
+        # job_link -> listing hash of the stored detail fields
+        self.enriched = {}
+        # job_link -> (write, listing hash) of detail fields whose posting
+        # is not stored yet
+        self.pending_details = {}
+        self.counts = {'new': 0, 'changed': 0, 'unchanged': 0}
+
+    def warm(self, documents):
+        """
+        Loads the stored hashes from ``{job_link, content_hash,
+        listing_hash}`` documents.
+        """
+        for document in documents:
+            self._load(document)
+        self.logger.info(
+            f'Loaded {len(self.known_hashes)} stored content hashes')
+
+    def _load(self, document):
+        link = document['job_link']
+        self.known_hashes[link] = document.get('content_hash')
+        if document.get('listing_hash'):
+            self.enriched[link] = document['listing_hash']
+
+    def operation(self, item):
+        """
+        Returns the write for ``item``, or None if the stored document is
+        already up to date, and the content hash to remember once the write
+        succeeds.
+        """
+        link = item['job_link']
+        digest = content_hash(item)
+        with self.lock:
+            previous = self.known_hashes.get(link, False)
+            if previous is False:
+                change = 'new'
+            elif previous == digest:
+                change = 'unchanged'
+            else:
+                change = 'changed'
+            self.counts[change] += 1
+            if self.stats is not None:
+                self.stats.inc_value(f'items/{change}')
+
+        now = datetime.now(timezone.utc)
+        if change == 'unchanged' and not self.rewrite:
+            if not self.touch_unchanged or not self.mark_seen:
+                return None, digest
+            return UpdateOne({'job_link': link},
+                             {'$set': {'last_seen': now}}), digest
+
+        document = dict(item)
+        document['content_hash'] = digest
+        on_insert = {'first_seen': now}
+        if self.mark_seen:
+            document['last_seen'] = now
+        else:
+            on_insert['last_seen'] = now
+        return UpdateOne(
+            {'job_link': link},
+            {'$set': document, '$setOnInsert': on_insert,
+             # The server's clock, so incremental exports miss no write
+             '$currentDate': {'updated_at': True}},
+            upsert=True,
+        ), digest
+
+    def detail_operation(self, item):
+        """Returns the write merging detail page fields into a posting."""
+        document = dict(item)
+        document['enriched_at'] = datetime.now(timezone.utc)
+        # Not upserted, so detail fields never make a posting on their own
+        return UpdateOne({'job_link': item['job_link']},
+                         {'$set': document,
+                          '$currentDate': {'updated_at': True}})
+
+    def touch_operation(self, job_links):
+        """
+        Returns the write updating ``last_seen`` of stored postings seen
+        again, or None if unchanged postings are not touched.
+        """
+        if not self.touch_unchanged or not self.mark_seen:
+            return None
+        if self.stats is not None:
+            with self.lock:
+                self.stats.inc_value('items/seen', len(job_links))
+        return UpdateMany({'job_link': {'$in': list(job_links)}},
+                          {'$set': {'last_seen': datetime.now(timezone.utc)}})
+
+    def summary(self):
+        return (f"{self.counts['new']} new, {self.counts['changed']} "
+                f"changed, {self.counts['unchanged']} unchanged postings")
+
+    def add(self, item):
+        self._append(item['job_link'], *self.operation(item))
+
+    def add_detail(self, item):
+        link = item['job_link']
+        if self._hold_detail(link, item):
+            return
+        self._append(link, self.detail_operation(item),
+                     listing_hash=item.get('listing_hash'))
+
+    def touch(self, job_links):
+        # Several postings per write, so the entry has no job link
+        self._append(None, self.touch_operation(job_links))
+
+    def _hold_detail(self, link, item):
+        """Keeps the detail fields of a posting not stored yet."""
+        with self.lock:
+            if link in self.known_hashes:
+                return False
+            self.pending_details[link] = (self.detail_operation(item),
+                                          item.get('listing_hash'))
+            return True
+
+    def _append(self, link, operation, digest=None, listing_hash=None):
+        if operation is None:
+            return
+        with self.lock:
+            self.buffer.append((link, operation, digest, listing_hash))
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush_if_due(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            batch = self._next_batch()
+            self.last_flush = time.monotonic()
+            if not batch:
+                return
+            self.writing += 1
+        try:
+            self._write(batch)
+        except Exception:
+            with self.lock:
+                self.unsaved[:0] = batch
+            raise
+        finally:
+            with self.lock:
+                self.writing -= 1
+
+    def _next_batch(self):
+        # Failed writes go again first, one batch at a time, topped up from
+        # the buffer so that a failing write moves new entries to unsaved
+        if self.unsaved:
+            batch = self.unsaved[:self.batch_size]
+            del self.unsaved[:self.batch_size]
+            room = self.batch_size - len(batch)
+            batch += self.buffer[:room]
+            del self.buffer[:room]
+            return batch
+        batch, self.buffer = self.buffer, []
+        return batch
+
+    def backlogged(self):
+        """True while failed writes fill a batch and new items should wait."""
+        with self.lock:
+            return len(self.unsaved) >= self.batch_size
+
+    def hold(self, job_link):
+        """
+        Records an item given up on at shutdown, so the spool keeps it for
+        the next run.
+        """
+        with self.lock:
+            self.held.add(job_link)
+
+    def drain(self):
+        """
+        Flushes until nothing is buffered, including the detail fields
+        released by the last batch.
+        """
+        self.flush()
+        while self.buffer or self.unsaved:
+            self.flush()
+        self._report_pending()
+
+    def _report_pending(self):
+        if self.pending_details:
+            self.logger.warning(
+                f'{len(self.pending_details)} detail pages were not stored, '
+                'as their postings were not')
+
+    def unsaved_links(self):
+        """
+        Job links of the operations waiting to be sent again or for their
+        posting to be stored, or None while operations are buffered or
+        being written.
+        """
+        with self.lock:
+            if self.buffer or self.writing:
+                return None
+            return ({entry[0] for entry in self.unsaved
+                     if entry[0] is not None}
+                    | set(self.pending_details) | self.held)
+
+    def _write(self, batch):
+        if self.before_write is not None:
+            self.before_write()
+        operations = [entry[1] for entry in batch]
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                result = self.collection.bulk_write(operations, ordered=False)
+                details = result.bulk_api_result
+                break
+            except BulkWriteError as e:
+                # Unordered batches keep going after a failed operation
+                details = e.details
+                break
+            except ConnectionFailure as e:
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self._retry_delay(attempt, len(batch), e))
+                attempt += 1
+        self._report(len(batch), details, time.monotonic() - start)
+        self._written(batch, details)
+
+    def _retry_delay(self, attempt, ops, error):
+        # Jittered so the writer threads do not retry in lockstep
+        delay = min(self.retry_max_delay, self.retry_delay * 2 ** attempt)
+        delay *= random.uniform(0.5, 1)
+        self.logger.warning(
+            f'Bulk write of {ops} ops failed ({error}), retrying in '
+            f'{delay:.1f} s')
+        if self.stats is not None:
+            with self.lock:
+                self.stats.inc_value('mongo/retries')
+        return delay
+
+    def _written(self, batch, details):
+        errors = {error['index']: error
+                  for error in details.get('writeErrors', [])}
+        stored, retried, rejected = [], [], []
+        with self.lock:
+            for i, entry in enumerate(batch):
+                link, error = entry[0], errors.get(i)
+                conflicts = self.conflicts.get(link, 0)
+                if error is None:
+                    stored.append(entry)
+                elif (error.get('code') in RETRYABLE_CODES
+                        and conflicts < self.retries):
+                    self.conflicts[link] = conflicts + 1
+                    retried.append(entry)
+                else:
+                    rejected.append((link, error))
+            self.unsaved.extend(retried)
+            for link, _ in rejected:
+                self.conflicts.pop(link, None)
+                # Nothing left to merge the detail fields into
+                self.pending_details.pop(link, None)
+            if rejected and self.stats is not None:
+                self.stats.inc_value('mongo/rejected', len(rejected))
+            # Only now, so a failed write is attempted again next time the
+            # posting is seen
+            for link, _, digest, listing_hash in stored:
+                self.conflicts.pop(link, None)
+                if digest is not None:
+                    self.known_hashes[link] = digest
+                    detail = self.pending_details.pop(link, None)
+                    if detail is not None:
+                        operation, detail_hash = detail
+                        self.buffer.append((link, operation, None, detail_hash))
+                if listing_hash is not None:
+                    self.enriched[link] = listing_hash
+        for link, error in rejected:
+            self.logger.error(
+                f"Rejected the write of {link or 'last_seen'}: "
+                f"{error.get('errmsg')}")
+        if retried:
+            self.logger.warning(
+                f'{len(retried)} writes hit duplicate keys, sending them '
+                'again')
+        if self.on_written is None:
+            return
+        self.on_written([entry[0] for entry in stored
+                         if entry[0] is not None])
+
+    def _report(self, ops, details, latency):
+        upserts = details.get('nUpserted', 0)
+        modified = details.get('nModified', 0)
+        self.logger.info(
+            f'Flushed batch: {ops} ops, {upserts} upserts, '
+            f'{modified} modified in {latency * 1000:.1f} ms')
+        self._record_stats(ops, upserts, modified, latency)
+        if self.observe is not None:
+            self.observe('mongo_write', latency)
+
+    def _record_stats(self, ops, upserts, modified, latency):
+        if self.stats is None:
+            return
+        with self.lock:
+            self.stats.inc_value('mongo/batches')
+            self.stats.inc_value('mongo/ops', ops)
+            self.stats.inc_value('mongo/upserts', upserts)
+            self.stats.inc_value('mongo/modified', modified)
+            self.stats.inc_value('mongo/batch_latency_ms_total',
+                                 round(latency * 1000))
+            self.stats.max_value('mongo/batch_latency_ms_max',
+                                 round(latency * 1000))
+
+
+class AsyncBulkWriter(BulkWriter):
+    """
+    Asyncio variant of BulkWriter for async MongoDB clients.
+
+    At most ``max_inflight`` batches are written at the same time. Callers
+    awaiting ``add`` or ``flush`` wait for a free slot, which holds back the
+    items behind them. ``qsize`` counts the entries not written yet, as the
+    async pipeline has no queue of its own.
+    """
+
+    def __init__(self, collection, batch_size=500, flush_interval=2.0,
+                 stats=None, logger=None, on_written=None,
+                 touch_unchanged=True, observe=None, retries=5,
+                 retry_delay=0.5, retry_max_delay=30.0, max_inflight=4,
+                 before_write=None):
+        super().__init__(collection, batch_size, flush_interval, stats,
+                         logger, on_written, touch_unchanged, observe,
+                         retries, retry_delay, retry_max_delay,
+                         before_write=before_write)
+        self.max_inflight = max_inflight
+        self.inflight = None
+        self.waiting = 0  # Entries held back by _wait_for_room
+        self.sending = 0  # Entries of the batches being written
+
+    def qsize(self):
+        return (self.waiting + len(self.buffer) + len(self.unsaved)
+                + self.sending)
+
+    async def warm(self, cursor):
+        async for document in cursor:
+            self._load(document)
+        self.logger.info(
+            f'Loaded {len(self.known_hashes)} stored content hashes')
+
+    async def add(self, item):
+        await self._append(item['job_link'], *self.operation(item))
+
+    async def _wait_for_room(self):
+        # Holds the caller, and so the spider, while failed writes fill a
+        # batch, sending them again until the server takes them
+        while self.backlogged():
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f'Error flushing items: {e}')
+                await asyncio.sleep(self.flush_interval)
+
+    async def add_detail(self, item):
+        link = item['job_link']
+        if self._hold_detail(link, item):
+            return
+        await self._append(link, self.detail_operation(item),
+                           listing_hash=item.get('listing_hash'))
+
+    async def touch(self, job_links):
+        await self._append(None, self.touch_operation(job_links))
+
+    async def _append(self, link, operation, digest=None, listing_hash=None):
+        if operation is None:
+            return
+        self.waiting += 1
+        try:
+            await self._wait_for_room()
+        finally:
+            self.waiting -= 1
+        # Only touched from the event loop, so the buffer needs no lock
+        self.buffer.append((link, operation, digest, listing_hash))
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush_if_due(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def drain(self):
+        await self.flush()
+        while self.buffer or self.unsaved:
+            await self.flush()
+        self._report_pending()
+
+    async def flush(self):
+        batch = self._next_batch()
+        self.last_flush = time.monotonic()
+        if not batch:
+            return
+        self.writing += 1
+        self.sending += len(batch)
+        try:
+            await self._write(batch)
+        except Exception:
+            self.unsaved[:0] = batch
+            raise
+        finally:
+            self.writing -= 1
+            self.sending -= len(batch)
+
+    async def _write(self, batch):
+        if self.inflight is None:
+            # Created lazily so it binds to the running event loop
+            self.inflight = asyncio.Semaphore(self.max_inflight)
+
+        if self.before_write is not None:
+            self.before_write()
+        operations = [entry[1] for entry in batch]
+        async with self.inflight:
+            attempt = 0
+            while True:
+                start = time.monotonic()
+                try:
+                    result = await self.collection.bulk_write(
+                        operations, ordered=False)
+                    details = result.bulk_api_result
+                    break
+                except BulkWriteError as e:
+                    details = e.details
+                    break
+                except ConnectionFailure as e:
+                    if attempt >= self.retries:
+                        raise
+                    await asyncio.sleep(
+                        self._retry_delay(attempt, len(batch), e))
+                    attempt += 1
+            self._report(len(batch), details, time.monotonic() - start)
+            self._written(batch, details)